@@ -16,13 +16,19 @@ def main (args : List String) : IO Unit := do
     | some cs => cs.map fun c => Syntax.decodeNameLit ("`" ++ c) |>.get!
     | none    => env.constants.toList.map Prod.fst |>.filter (!·.isInternal)
 
-  -- Open the output file and redirect stdout
-  let filePath := "Export.txt"
-  IO.FS.withFile filePath IO.FS.Mode.write fun handle => do
-    let stream := IO.FS.Stream.ofHandle handle
-    IO.withStdout stream do
-      -- Run the M monad to process constants
-      let _ ← M.run env do
-        for c in constants do
-          let _ ← dumpConstant c
+  -- Run the M monad to process constants
+  let runExport : IO Unit := do
+    let _ ← M.run env do
+      for c in constants do
+        let _ ← dumpConstant c
+
+  -- Write to EXPORT_PATH (default Export.txt), or to stdout if it is "-"
+  let filePath := (← IO.getEnv "EXPORT_PATH").getD "Export.txt"
+  if filePath == "-" then
+    runExport
+  else
+    -- Open the output file and redirect stdout
+    IO.FS.withFile filePath IO.FS.Mode.write fun handle => do
+      let stream := IO.FS.Stream.ofHandle handle
+      IO.withStdout stream runExport
   return ()
@@ -1,448 +1,1204 @@
 """
-Table of contents, in order of weak dependence. 
+Table of contents, in order of weak dependence.
 
+    decode_command
+    record_identity
+    record_references
+    record_dependencies
     compute_identity
     parse_declaration
     compute_edge_list
+    EdgeStream
+    stream_edge_list
+    Graph
+    build_graph
+    assemble_graph
+    write_binary_graph
+    BinaryGraph
+    topological_order
+    group_g_references
+    structural_hashes
 """
 
+import array
+import ast
+import hashlib
+import mmap
+import struct
+import sys
+import zipfile
+from collections import namedtuple
+
+
+# Every kind marker the exporter emits, in a fixed order. The position of a
+# marker in this tuple is its kind code; records carry the code, not the string.
+KIND_MARKERS = (
+    "#NS", "#NI",
+    "#US", "#UM", "#UIM", "#UP",
+    "#EV", "#ES", "#EC", "#EA", "#EL", "#EP",
+    "#DEF", "#AX",
+    "#IND",
+    "#EJ", "#ELN", "#ELS", "#EZ",
+)
+KIND_CODES = {marker: code for code, marker in enumerate(KIND_MARKERS)}
+GROUPS = ("A", "B", "C", "D", "E", "G")
+GROUP_CODES = {group: code for code, group in enumerate(GROUPS)}
+KIND_GROUPS = (
+    "A", "A",
+    "B", "B", "B", "B",
+    "C", "C", "C", "C", "C", "C",
+    "D", "D",
+    "E",
+    "G", "G", "G", "G",
+)
+
+# A decoded declaration command.
+#   - kind is the kind code (an index into KIND_MARKERS),
+#   - unique_id is the integer identifier of the declaration,
+#   - operands is a tuple of the integer tokens the kind may reference
+#     (None where a token is not an integer),
+#   - extra is the label suffix, or None when the label has no suffix.
+Record = namedtuple("Record", ["kind", "unique_id", "operands", "extra"])
+
+# Slot names are shared strings rather than being formatted once per edge.
+_SLOTS = tuple(f"n{i}" for i in range(64))
+
+
+def _slot(i):
+    return _SLOTS[i] if i < 64 else f"n{i}"
+
+
+def _int_or_none(part):
+    try:
+        return int(part)
+    except ValueError:
+        return None
+
+
+def _ints_or_none(parts):
+    return tuple(_int_or_none(part) for part in parts)
+
+
+# ---------------------------------------------------------------------------
+# Decoders. Each one turns the tokens of a single line into a Record.
+# ---------------------------------------------------------------------------
+
+def _decode_ns(parts):
+    # About the meaning:
+    # Group A (Hierarchical name, kind NS):
+    #   Format: n' ⨆ #NS ⨆ n0 ⨆ s
+    #   n' is the unique identifier for the name,
+    #   n0 (slot "n0") is a unique integer for a Group A declaration,
+    #   s is an extra string.
+    extra = parts[3] if len(parts) >= 4 else ""
+    return Record(0, int(parts[0]), (int(parts[2]),), extra)
+
+
+def _decode_ni(parts):
+    # About the meaning:
+    # Group A (Hierarchical name, kind NI):
+    #   Format: n' ⨆ #NI ⨆ n0 ⨆ z
+    #   z is an integer providing additional info.
+    extra = parts[3] if len(parts) >= 4 else ""
+    return Record(1, int(parts[0]), (int(parts[2]),), extra)
+
+
+def _decode_us(parts):
+    # About the meaning:
+    # Group B (Universe, kind US):
+    #   Format: n' ⨆ #US ⨆ n0
+    return Record(2, int(parts[0]), _ints_or_none(parts[2:]), None)
+
+
+def _decode_um(parts):
+    # About the meaning:
+    # Group B (Universe, kind UM):
+    #   Format: n' ⨆ #UM ⨆ n0 ⨆ n1
+    extra = f"{parts[2]}_{parts[3]}" if len(parts) >= 4 else None
+    return Record(3, int(parts[0]), _ints_or_none(parts[2:]), extra)
+
+
+def _decode_uim(parts):
+    # About the meaning:
+    # Group B (Universe, kind UIM):
+    #   Format: n' ⨆ #UIM ⨆ n0 ⨆ n1
+    extra = f"{parts[2]}_{parts[3]}" if len(parts) >= 4 else None
+    return Record(4, int(parts[0]), _ints_or_none(parts[2:]), extra)
+
+
+def _decode_up(parts):
+    # About the meaning:
+    # Group B (Universe, kind UP):
+    #   Format: n' ⨆ #UP ⨆ n0
+    #   Note: The dependent is actually in Group A.
+    extra = parts[2] if len(parts) >= 3 else None
+    return Record(5, int(parts[0]), _ints_or_none(parts[2:]), extra)
+
+
+def _decode_ev(parts):
+    # About the meaning:
+    # Group C (Expression, kind EV):
+    #   Format: n' ⨆ #EV ⨆ z
+    #   z is an integer providing extra info.
+    extra = parts[2] if len(parts) >= 3 else ""
+    return Record(6, int(parts[0]), (), extra)
+
+
+def _decode_es(parts):
+    # About the meaning:
+    # Group C (Expression, kind ES):
+    #   Format: n' ⨆ #ES ⨆ n0,
+    #   where n0 is from Group B.
+    extra = parts[2] if len(parts) >= 3 else None
+    return Record(7, int(parts[0]), (int(parts[2]),), extra)
+
+
+def _decode_ec(parts):
+    # About the meaning:
+    # Group C (Expression, kind EC):
+    #   Format: n' ⨆ #EC ⨆ n0 ⨆ overline{n0}
+    #   The first dependency (slot "n0") is from Group A;
+    #   the remainder (if any) come from Group B.
+    extra = "_".join(parts[2:]) if len(parts) > 2 else ""
+    operands = (int(parts[2]),) + _ints_or_none(parts[3:])
+    return Record(8, int(parts[0]), operands, extra)
+
+
+def _decode_ea(parts):
+    # About the meaning:
+    # Group C (Expression, kind EA):
+    #   Format: n' ⨆ #EA ⨆ n0 ⨆ n1
+    #   Both dependencies are in Group C.
+    extra = f"{parts[2]}_{parts[3]}" if len(parts) >= 4 else ""
+    return Record(9, int(parts[0]), (int(parts[2]), int(parts[3])), extra)
+
+
+def _decode_el(parts):
+    # About the meaning:
+    # Group C (Expression, kind EL):
+    #   Format: n' ⨆ #EL ⨆ s ⨆ n0 ⨆ n1 ⨆ n2
+    #   s (slot "s") is extra info; dependency n0 is from Group A and n1,n2 from Group C.
+    extra = parts[2] if len(parts) >= 3 else ""
+    operands = (int(parts[3]), int(parts[4]), int(parts[5]))
+    return Record(10, int(parts[0]), operands, extra)
+
+
+def _decode_ep(parts):
+    # About the meaning:
+    # Group C (Expression, kind EP):
+    #   Format: n' ⨆ #EP ⨆ s ⨆ n0 ⨆ n1 ⨆ n2
+    extra = parts[2] if len(parts) >= 3 else ""
+    operands = (int(parts[3]), int(parts[4]), int(parts[5]))
+    return Record(11, int(parts[0]), operands, extra)
+
+
+def _decode_def(parts):
+    # About the meaning:
+    # Group D (Definition, kind DEF):
+    #   Format: #DEF ⨆ n' ⨆ n0 ⨆ n1 ⨆ overline{n0}
+    operands = (int(parts[2]), int(parts[3])) + _ints_or_none(parts[4:])
+    return Record(12, int(parts[1]), operands, None)
+
+
+def _decode_ax(parts):
+    # About the meaning:
+    # Group D (Axiom, kind AX):
+    #   Format: #AX ⨆ n' ⨆ n0 ⨆ overline{n0}
+    operands = (int(parts[2]),) + _ints_or_none(parts[3:])
+    return Record(13, int(parts[1]), operands, None)
+
+
+def _decode_ind(parts):
+    # About the meaning:
+    # Group E (Inductive definition, kind IND):
+    #   Format: #IND ⨆ n0 ⨆ n' ⨆ n1 ⨆ n2 ⨆ overline{n0} ⨆ overline{n1}
+    #   We choose n' (the third token) as the unique id for naming.
+    #   Operands start at n1, so operands[1] is the pair count n2.
+    operands = (int(parts[3]), int(parts[4])) + _ints_or_none(parts[5:])
+    return Record(14, int(parts[2]), operands, None)
+
+
+def _decode_ej(parts):
+    # About the meaning:
+    # Group G (Format extension, kind EJ):
+    #   Format: n' ⨆ #EJ ⨆ n0 ⨆ z ⨆ n1
+    extra = parts[3] if len(parts) >= 5 else ""
+    return Record(15, int(parts[0]), (int(parts[2]), int(parts[4])), extra)
+
+
+def _decode_eln(parts):
+    # About the meaning:
+    # Group G (Format extension, kind ELN):
+    #   Format: n' ⨆ #ELN ⨆ z
+    extra = parts[2] if len(parts) >= 3 else ""
+    return Record(16, int(parts[0]), (), extra)
+
+
+def _decode_els(parts):
+    # About the meaning:
+    # Group G (Format extension, kind ELS):
+    #   Format: n' ⨆ #ELS ⨆ overline{h}
+    extra = "_".join(parts[2:]) if len(parts) > 2 else ""
+    return Record(17, int(parts[0]), (), extra)
+
+
+def _decode_ez(parts):
+    # About the meaning:
+    # Group G (Format extension, kind EZ):
+    #   Format: n' ⨆ #EZ ⨆ n0 ⨆ n1 ⨆ n2 ⨆ n3
+    operands = (int(parts[2]),) + _ints_or_none(parts[3:6])
+    if len(operands) < 4:
+        raise ValueError("#EZ declaration command needs four operands.")
+    return Record(18, int(parts[0]), operands, None)
+
+
+_DECODERS = {
+    "#NS": _decode_ns,
+    "#NI": _decode_ni,
+    "#US": _decode_us,
+    "#UM": _decode_um,
+    "#UIM": _decode_uim,
+    "#UP": _decode_up,
+    "#EV": _decode_ev,
+    "#ES": _decode_es,
+    "#EC": _decode_ec,
+    "#EA": _decode_ea,
+    "#EL": _decode_el,
+    "#EP": _decode_ep,
+    "#DEF": _decode_def,
+    "#AX": _decode_ax,
+    "#IND": _decode_ind,
+    "#EJ": _decode_ej,
+    "#ELN": _decode_eln,
+    "#ELS": _decode_els,
+    "#EZ": _decode_ez,
+}
+
+
+def decode_command(command):
+    """
+    Decodes a declaration command into a Record in a single pass.
+
+    The line is split once, its kind marker (the first token starting with "#")
+    is located, and the decoder registered for that marker in the dispatch table
+    extracts the unique id, the integer operands and the label suffix.
+
+    Raises ValueError if the line has no kind marker or an unknown one, or if an
+    operand the kind refers to is missing or not an integer.
+    """
+    parts = command.split()
+    # The marker is the second token for most kinds and the first for
+    # #DEF/#AX/#IND; only fall back to a scan for anything else.
+    if len(parts) > 1 and parts[1][:1] == "#" and parts[0][:1] != "#":
+        kind = parts[1]
+    else:
+        kind = next((part for part in parts if part.startswith("#")), None)
+        if kind is None:
+            raise ValueError("No valid kind marker found in the declaration command.")
+    decoder = _DECODERS.get(kind)
+    if decoder is None:
+        raise ValueError("Invalid kind marker for declaration command.")
+    try:
+        return decoder(parts)
+    except IndexError:
+        raise ValueError(f"Missing operands in {kind} declaration command.") from None
+
+
+def record_identity(record):
+    """
+    Computes the vertex (group, unique_id, label) of a decoded record.
+    """
+    group = KIND_GROUPS[record.kind]
+    unique_id = record.unique_id
+    extra = record.extra
+    if extra is None:
+        return (group, unique_id, f"{group}_{unique_id}")
+    return (group, unique_id, f"{group}_{unique_id}_{extra}")
+
+
+# ---------------------------------------------------------------------------
+# Reference extractors. Each one lists the (group, linked_id, slot) triples a
+# record refers to, before any lookup against the known vertices.
+# ---------------------------------------------------------------------------
+
+def _refs_name(record):
+    # Group A declaration.
+    # Format: n' ⨆ #NS/NI ⨆ n0 ⨆ s/z.
+    # Dependency: slot "n0" from Group A.
+    return [("A", record.operands[0], "n0")]
+
+
+def _refs_universe(record):
+    # Group B declarations.
+    # For #US: Format: n' ⨆ #US ⨆ n0  → dependency slot "n0" from Group B.
+    # For #UM/#UIM: Format: n' ⨆ #UM/#UIM ⨆ n0 ⨆ n1  → dependencies "n0" and "n1" from Group B.
+    return [("B", linked_id, _slot(i))
+            for i, linked_id in enumerate(record.operands) if linked_id is not None]
+
+
+def _refs_up(record):
+    # For #UP: Format: n' ⨆ #UP ⨆ n0  → dependency "n0" but lookup in Group A.
+    return [("A", linked_id, _slot(i))
+            for i, linked_id in enumerate(record.operands) if linked_id is not None]
+
+
+def _refs_none(record):
+    # Kinds EV, ELN and ELS have no hierarchical dependencies.
+    return []
+
+
+def _refs_es(record):
+    # Group C (Expression, kind ES): Format: n' ⨆ #ES ⨆ n0,
+    # where n0 (slot "n0") comes from Group B.
+    return [("B", record.operands[0], "n0")]
+
+
+def _refs_ec(record):
+    # Group C (Expression, kind EC): Format: n' ⨆ #EC ⨆ n0 ⨆ overline{n0}.
+    # The first dependency (slot "n0") is from Group A;
+    # subsequent dependencies (slots "n1", "n2", …) are from Group B.
+    operands = record.operands
+    refs = [("A", operands[0], "n0")]
+    for i in range(1, len(operands)):
+        if operands[i] is not None:
+            refs.append(("B", operands[i], _slot(i)))
+    return refs
+
+
+def _refs_ea(record):
+    # Group C (Expression, kind EA): Format: n' ⨆ #EA ⨆ n0 ⨆ n1.
+    # Dependencies: slot "n0" and slot "n1", both from Group C.
+    operands = record.operands
+    return [("C", operands[0], "n0"), ("C", operands[1], "n1")]
+
+
+def _refs_binder(record):
+    # Group C (Expression, kinds EL/EP): Format: n' ⨆ #EL/EP ⨆ s ⨆ n0 ⨆ n1 ⨆ n2.
+    # Dependency: slot "n0" from Group A; slots "n1" and "n2" from Group C.
+    operands = record.operands
+    return [("A", operands[0], "n0"), ("C", operands[1], "n1"), ("C", operands[2], "n2")]
+
+
+def _refs_def(record):
+    # Group D (Definition, kind DEF): Format: #DEF ⨆ n' ⨆ n0 ⨆ n1 ⨆ overline{n0}.
+    # Dependencies: slot "n0" and "n1" from Group C;
+    # remaining parts (slots "n2", …) from Group A.
+    operands = record.operands
+    refs = [("C", operands[0], "n0"), ("C", operands[1], "n1")]
+    for i in range(2, len(operands)):
+        if operands[i] is not None:
+            refs.append(("A", operands[i], _slot(i)))
+    return refs
+
+
+def _refs_ax(record):
+    # Group D (Axiom, kind AX): Format: #AX ⨆ n' ⨆ n0 ⨆ overline{n0}.
+    # Dependency: slot "n0" from Group C; remaining parts (slots "n1", …) from Group A.
+    operands = record.operands
+    refs = [("C", operands[0], "n0")]
+    for i in range(1, len(operands)):
+        if operands[i] is not None:
+            refs.append(("A", operands[i], _slot(i)))
+    return refs
+
+
+def _refs_ind(record):
+    # Group E (Inductive definition, kind IND):
+    # Format: #IND ⨆ n0 ⨆ n' ⨆ n1 ⨆ n2 ⨆ overline{n0} ⨆ overline{n1}.
+    # Here n0 (number of parameters) and n2 (number of intro rules) are counts.
+    # The dependency: slot "n1" from Group C.
+    # Then overline{n0} yields pairs: each pair gives one dependency from Group A and one from Group C.
+    # Finally, overline{n1} yields dependencies from Group A.
+    operands = record.operands
+    refs = [("C", operands[0], "n1")]
+    num_pairs = operands[1]
+    for pair_index in range(num_pairs):
+        linked_id_a = operands[2 + 2 * pair_index]
+        if linked_id_a is None:
+            continue
+        refs.append(("A", linked_id_a, f"pair{pair_index}_A"))
+        linked_id_c = operands[3 + 2 * pair_index]
+        if linked_id_c is not None:
+            refs.append(("C", linked_id_c, f"pair{pair_index}_C"))
+    start = 2 + 2 * max(num_pairs, 0)
+    for j in range(start, len(operands)):
+        if operands[j] is not None:
+            refs.append(("A", operands[j], f"n_overline{j - start}"))
+    return refs
+
+
+def _refs_ej(record):
+    # Group G (Format extension, kind EJ):
+    # Format: n' ⨆ #EJ ⨆ n0 ⨆ z ⨆ n1.
+    # Dependencies: slot "n0" from Group A; slot "n1" from Group C.
+    operands = record.operands
+    return [("A", operands[0], "n0"), ("C", operands[1], "n1")]
+
+
+def _refs_ez(record):
+    # Group G (Format extension, kind EZ):
+    # Format: n' ⨆ #EZ ⨆ n0 ⨆ n1 ⨆ n2 ⨆ n3.
+    # Dependency: slot "n0" from Group A; slots "n1", "n2", and "n3" from Group C.
+    operands = record.operands
+    refs = [("A", operands[0], "n0")]
+    for i in range(1, 4):
+        if operands[i] is not None:
+            refs.append(("C", operands[i], _slot(i)))
+    return refs
+
+
+# Indexed by kind code, in the order of KIND_MARKERS.
+_REFERENCES = (
+    _refs_name, _refs_name,
+    _refs_universe, _refs_universe, _refs_universe, _refs_up,
+    _refs_none, _refs_es, _refs_ec, _refs_ea, _refs_binder, _refs_binder,
+    _refs_def, _refs_ax,
+    _refs_ind,
+    _refs_ej, _refs_none, _refs_none, _refs_ez,
+)
+
+
+def record_references(record):
+    """
+    Lists every reference a decoded record makes, as (group, linked_id, slot)
+    triples, whether or not the referenced vertex is known.
+    """
+    return _REFERENCES[record.kind](record)
+
+
+def record_dependencies(record, vertices_dict):
+    """
+    Returns the (vertex, dependency_kind) pairs of a decoded record whose keys
+    (group, linked_id) are present in vertices_dict.
+    """
+    dependents = []
+    for group, linked_id, slot in _REFERENCES[record.kind](record):
+        vertex = vertices_dict.get((group, linked_id))
+        if vertex is not None:
+            dependents.append((vertex, slot))
+    return dependents
+
+
 def compute_identity(command):
     """
     Computes the identity of a declaration command.
-    
+
     Returns a tuple (group, unique_id, label) where:
        - group is one of "A", "B", "C", "D", "E", or "G"
        - unique_id is the integer identifier computed from the command
        - label is a string that incorporates additional information (if available)
-    
+
     The label is constructed to include extra details from the command so that
     vertices in the output graph are more descriptively named.
+
+    The whole command is decoded (decode_command), so a command whose operands are
+    missing or not integers raises ValueError even where its identity alone could
+    be read, e.g. "5 #EZ 1 2".
     """
-    parts = command.split()
-    kind = next((part for part in parts if part.startswith("#")), None)
-    if kind is None:
-        raise ValueError("No valid kind marker found in the declaration command.")
-    
-    # Initialize extra information as empty.
-    extra = ""
-    
-    if kind == "#NS":
-        # About the meaning:
-        # Group A (Hierarchical name, kind NS):
-        #   Format: n' ⨆ #NS ⨆ n0 ⨆ s
-        #   n' is the unique identifier for the name,
-        #   n0 (slot "n0") is a unique integer for a Group A declaration,
-        #   s is an extra string.
-        group = "A"
-        unique_id = int(parts[0])
-        extra = parts[3] if len(parts) >= 4 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#NI":
-        # About the meaning:
-        # Group A (Hierarchical name, kind NI):
-        #   Format: n' ⨆ #NI ⨆ n0 ⨆ z
-        #   z is an integer providing additional info.
-        group = "A"
-        unique_id = int(parts[0])
-        extra = parts[3] if len(parts) >= 4 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#US":
-        # About the meaning:
-        # Group B (Universe, kind US):
-        #   Format: n' ⨆ #US ⨆ n0
-        group = "B"
-        unique_id = int(parts[0])
-        label = f"{group}_{unique_id}"
-    elif kind == "#UM":
-        # About the meaning:
-        # Group B (Universe, kind UM):
-        #   Format: n' ⨆ #UM ⨆ n0 ⨆ n1
-        group = "B"
-        unique_id = int(parts[0])
-        if len(parts) >= 4:
-            label = f"{group}_{unique_id}_{parts[2]}_{parts[3]}"
-        else:
-            label = f"{group}_{unique_id}"
-    elif kind == "#UIM":
-        # About the meaning:
-        # Group B (Universe, kind UIM):
-        #   Format: n' ⨆ #UIM ⨆ n0 ⨆ n1
-        group = "B"
-        unique_id = int(parts[0])
-        if len(parts) >= 4:
-            label = f"{group}_{unique_id}_{parts[2]}_{parts[3]}"
-        else:
-            label = f"{group}_{unique_id}"
-    elif kind == "#UP":
-        # About the meaning:
-        # Group B (Universe, kind UP):
-        #   Format: n' ⨆ #UP ⨆ n0
-        #   Note: The dependent is actually in Group A.
-        group = "B"
-        unique_id = int(parts[0])
-        label = f"{group}_{unique_id}_{parts[2]}" if len(parts) >= 3 else f"{group}_{unique_id}"
-    elif kind == "#EV":
-        # About the meaning:
-        # Group C (Expression, kind EV):
-        #   Format: n' ⨆ #EV ⨆ z
-        #   z is an integer providing extra info.
-        group = "C"
-        unique_id = int(parts[0])
-        extra = parts[2] if len(parts) >= 3 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#ES":
-        # About the meaning:
-        # Group C (Expression, kind ES):
-        #   Format: n' ⨆ #ES ⨆ n0,
-        #   where n0 is from Group B.
-        group = "C"
-        unique_id = int(parts[0])
-        label = f"{group}_{unique_id}_{parts[2]}" if len(parts) >= 3 else f"{group}_{unique_id}"
-    elif kind == "#EC":
-        # About the meaning:
-        # Group C (Expression, kind EC):
-        #   Format: n' ⨆ #EC ⨆ n0 ⨆ overline{n0}
-        #   The first dependency (slot "n0") is from Group A;
-        #   the remainder (if any) come from Group B.
-        group = "C"
-        unique_id = int(parts[0])
-        extra = "_".join(parts[2:]) if len(parts) > 2 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#EA":
-        # About the meaning:
-        # Group C (Expression, kind EA):
-        #   Format: n' ⨆ #EA ⨆ n0 ⨆ n1
-        #   Both dependencies are in Group C.
-        group = "C"
-        unique_id = int(parts[0])
-        extra = f"{parts[2]}_{parts[3]}" if len(parts) >= 4 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#EL":
-        # About the meaning:
-        # Group C (Expression, kind EL):
-        #   Format: n' ⨆ #EL ⨆ s ⨆ n0 ⨆ n1 ⨆ n2
-        #   s (slot "s") is extra info; dependency n0 is from Group A and n1,n2 from Group C.
-        group = "C"
-        unique_id = int(parts[0])
-        extra = parts[2] if len(parts) >= 3 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#EP":
-        # About the meaning:
-        # Group C (Expression, kind EP):
-        #   Format: n' ⨆ #EP ⨆ s ⨆ n0 ⨆ n1 ⨆ n2
-        group = "C"
-        unique_id = int(parts[0])
-        extra = parts[2] if len(parts) >= 3 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#DEF":
-        # About the meaning:
-        # Group D (Definition, kind DEF):
-        #   Format: #DEF ⨆ n' ⨆ n0 ⨆ n1 ⨆ overline{n0}
-        group = "D"
-        unique_id = int(parts[1])
-        label = f"{group}_{unique_id}"
-    elif kind == "#AX":
-        # About the meaning:
-        # Group D (Axiom, kind AX):
-        #   Format: #AX ⨆ n' ⨆ n0 ⨆ overline{n0}
-        group = "D"
-        unique_id = int(parts[1])
-        label = f"{group}_{unique_id}"
-    elif kind == "#IND":
-        # About the meaning:
-        # Group E (Inductive definition, kind IND):
-        #   Format: #IND ⨆ n0 ⨆ n' ⨆ n1 ⨆ n2 ⨆ overline{n0} ⨆ overline{n1}
-        #   We choose n' (the third token) as the unique id for naming.
-        group = "E"
-        unique_id = int(parts[2])
-        label = f"{group}_{unique_id}"
-    elif kind == "#EJ":
-        # About the meaning:
-        # Group G (Format extension, kind EJ):
-        #   Format: n' ⨆ #EJ ⨆ n0 ⨆ z ⨆ n1
-        group = "G"
-        unique_id = int(parts[0])
-        extra = parts[3] if len(parts) >= 5 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#ELN":
-        # About the meaning:
-        # Group G (Format extension, kind ELN):
-        #   Format: n' ⨆ #ELN ⨆ z
-        group = "G"
-        unique_id = int(parts[0])
-        extra = parts[2] if len(parts) >= 3 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#ELS":
-        # About the meaning:
-        # Group G (Format extension, kind ELS):
-        #   Format: n' ⨆ #ELS ⨆ overline{h}
-        group = "G"
-        unique_id = int(parts[0])
-        extra = "_".join(parts[2:]) if len(parts) > 2 else ""
-        label = f"{group}_{unique_id}_{extra}"
-    elif kind == "#EZ":
-        # About the meaning:
-        # Group G (Format extension, kind EZ):
-        #   Format: n' ⨆ #EZ ⨆ n0 ⨆ n1 ⨆ n2 ⨆ n3
-        group = "G"
-        unique_id = int(parts[0])
-        label = f"{group}_{unique_id}"
-    else:
-        raise ValueError("Invalid kind marker for declaration command.")
-    
-    return (group, unique_id, label)
+    return record_identity(decode_command(command))
 
 
 def parse_declaration(command, vertices_dict):
     """
     Parses a declaration command and returns a list of dependent vertices along with
     the dependency kind (i.e. which slot in the command produced the dependency).
-    
+
     This function uses a precomputed dictionary (vertices_dict) that maps keys of the form
        (group, unique_id)
     to vertex tuples (group, unique_id, label).
-    
+
     Returns:
         List of tuples (vertex, dependency_kind) corresponding to the dependents.
     """
-    parts = command.split()
-    kind = next((part for part in parts if part.startswith("#")), None)
-    if kind is None:
-        raise ValueError("No valid kind marker found in the declaration command.")
-    
-    dependents = []
-    
-    if kind in {"#NS", "#NI"}:
-        # About the meaning:
-        # Group A declaration.
-        # Format: n' ⨆ #NS/NI ⨆ n0 ⨆ s/z.
-        # Dependency: slot "n0" (parts[2]) from Group A.
-        linked_id = int(parts[2])
-        key = ("A", linked_id)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-            
-    elif kind in {"#US", "#UM", "#UIM", "#UP"}:
-        # About the meaning:
-        # Group B declarations.
-        # For #US: Format: n' ⨆ #US ⨆ n0  → dependency slot "n0" from Group B.
-        # For #UM/#UIM: Format: n' ⨆ #UM/#UIM ⨆ n0 ⨆ n1  → dependencies "n0" and "n1" from Group B.
-        # For #UP: Format: n' ⨆ #UP ⨆ n0  → dependency "n0" but lookup in Group A.
-        for i, part in enumerate(parts[2:]):
-            try:
-                linked_id = int(part)
-                slot = f"n{i}"
-                group_lookup = "A" if kind == "#UP" else "B"
-                key = (group_lookup, linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-            
-    elif kind == "#EV":
-        # About the meaning:
-        # Group C (Expression, kind EV) has no hierarchical dependencies.
-        pass
-    
-    elif kind == "#ES":
-        # About the meaning:
-        # Group C (Expression, kind ES): Format: n' ⨆ #ES ⨆ n0,
-        # where n0 (slot "n0") comes from Group B.
-        linked_id = int(parts[2])
-        key = ("B", linked_id)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-            
-    elif kind == "#EC":
-        # About the meaning:
-        # Group C (Expression, kind EC): Format: n' ⨆ #EC ⨆ n0 ⨆ overline{n0}.
-        # The first dependency (slot "n0") is from Group A;
-        # subsequent dependencies (slots "n1", "n2", …) are from Group B.
-        linked_id = int(parts[2])
-        key = ("A", linked_id)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        for i, part in enumerate(parts[3:]):
-            try:
-                linked_id = int(part)
-                slot = f"n{i+1}"
-                key = ("B", linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-            
-    elif kind == "#EA":
-        # About the meaning:
-        # Group C (Expression, kind EA): Format: n' ⨆ #EA ⨆ n0 ⨆ n1.
-        # Dependencies: slot "n0" and slot "n1", both from Group C.
-        linked_id1 = int(parts[2])
-        key = ("C", linked_id1)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        linked_id2 = int(parts[3])
-        key = ("C", linked_id2)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n1"))
-            
-    elif kind in {"#EL", "#EP"}:
-        # About the meaning:
-        # Group C (Expression, kinds EL/EP): Format: n' ⨆ #EL/EP ⨆ s ⨆ n0 ⨆ n1 ⨆ n2.
-        # Dependency: slot "n0" (parts[3]) from Group A; slots "n1" and "n2" (parts[4] and [5]) from Group C.
-        linked_id0 = int(parts[3])
-        key = ("A", linked_id0)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        linked_id1 = int(parts[4])
-        key = ("C", linked_id1)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n1"))
-        linked_id2 = int(parts[5])
-        key = ("C", linked_id2)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n2"))
-            
-    elif kind == "#DEF":
-        # About the meaning:
-        # Group D (Definition, kind DEF): Format: #DEF ⨆ n' ⨆ n0 ⨆ n1 ⨆ overline{n0}.
-        # Dependencies: slot "n0" (parts[2]) and "n1" (parts[3]) from Group C;
-        # remaining parts (slots "n2", …) from Group A.
-        linked_id1 = int(parts[2])
-        key = ("C", linked_id1)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        linked_id2 = int(parts[3])
-        key = ("C", linked_id2)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n1"))
-        for i, part in enumerate(parts[4:]):
-            try:
-                linked_id = int(part)
-                slot = f"n{i+2}"
-                key = ("A", linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-            
-    elif kind == "#AX":
-        # About the meaning:
-        # Group D (Axiom, kind AX): Format: #AX ⨆ n' ⨆ n0 ⨆ overline{n0}.
-        # Dependency: slot "n0" (parts[2]) from Group C; remaining parts (slots "n1", …) from Group A.
-        linked_id0 = int(parts[2])
-        key = ("C", linked_id0)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        for i, part in enumerate(parts[3:]):
-            try:
-                linked_id = int(part)
-                slot = f"n{i+1}"
-                key = ("A", linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-            
-    elif kind == "#IND":
-        # About the meaning:
-        # Group E (Inductive definition, kind IND):
-        # Format: #IND ⨆ n0 ⨆ n' ⨆ n1 ⨆ n2 ⨆ overline{n0} ⨆ overline{n1}.
-        # Here n0 (number of parameters) and n2 (number of intro rules) are counts.
-        # The dependency: slot "n1" (parts[3]) from Group C.
-        # Then overline{n0} yields pairs: each pair gives one dependency from Group A and one from Group C.
-        # Finally, overline{n1} yields dependencies from Group A.
-        linked_id1 = int(parts[3])
-        key = ("C", linked_id1)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n1"))
-        num_pairs = int(parts[4])
-        for i in range(5, 5 + 2 * num_pairs, 2):
-            try:
-                linked_id_a = int(parts[i])
-                key = ("A", linked_id_a)
-                pair_index = (i - 5) // 2
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], f"pair{pair_index}_A"))
-                linked_id_c = int(parts[i + 1])
-                key = ("C", linked_id_c)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], f"pair{pair_index}_C"))
-            except ValueError:
-                continue
-        start = 5 + 2 * num_pairs
-        for j, part in enumerate(parts[start:]):
-            try:
-                linked_id = int(part)
-                slot = f"n_overline{j}"
-                key = ("A", linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-            
-    elif kind == "#EJ":
-        # About the meaning:
-        # Group G (Format extension, kind EJ):
-        # Format: n' ⨆ #EJ ⨆ n0 ⨆ z ⨆ n1.
-        # Dependencies: slot "n0" (parts[2]) from Group A; slot "n1" (parts[4]) from Group C.
-        linked_id0 = int(parts[2])
-        key = ("A", linked_id0)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        linked_id1 = int(parts[4])
-        key = ("C", linked_id1)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n1"))
-            
-    elif kind == "#ELN":
-        # About the meaning:
-        # Group G (Format extension, kind ELN):
-        # Format: n' ⨆ #ELN ⨆ z.
-        # No hierarchical dependencies.
-        pass
-        
-    elif kind == "#ELS":
-        # About the meaning:
-        # Group G (Format extension, kind ELS):
-        # Format: n' ⨆ #ELS ⨆ overline{h}.
-        # No hierarchical dependencies.
-        pass
-        
-    elif kind == "#EZ":
-        # About the meaning:
-        # Group G (Format extension, kind EZ):
-        # Format: n' ⨆ #EZ ⨆ n0 ⨆ n1 ⨆ n2 ⨆ n3.
-        # Dependency: slot "n0" (parts[2]) from Group A; slots "n1", "n2", and "n3" (parts[3]-[5]) from Group C.
-        linked_id0 = int(parts[2])
-        key = ("A", linked_id0)
-        if key in vertices_dict:
-            dependents.append((vertices_dict[key], "n0"))
-        for i in range(3, 6):
-            try:
-                linked_id = int(parts[i])
-                slot = f"n{i-2}"  # i=3 -> "n1", i=4 -> "n2", i=5 -> "n3"
-                key = ("C", linked_id)
-                if key in vertices_dict:
-                    dependents.append((vertices_dict[key], slot))
-            except ValueError:
-                continue
-    return dependents
+    return record_dependencies(decode_command(command), vertices_dict)
 
 
 def compute_edge_list(command, vertices_dict):
     """
     Computes the edge list for a given declaration command.
-    
+
     Each edge is a tuple (source, target, dependency_kind), where:
       - source is the vertex (group, unique_id, label) computed from the command,
       - target is the dependent vertex,
       - dependency_kind is the slot label captured during parsing.
-    
-    This uses efficient lookups via vertices_dict.
-    """
-    source = compute_identity(command)
-    deps = parse_declaration(command, vertices_dict)
-    edge_list = []
-    for target, dep_kind in deps:
-        edge_list.append((source, target, dep_kind))
-    return edge_list
+
+    The command is decoded once and shared by identity and dependency extraction.
+    It may be a command string or an already decoded Record.
+    """
+    record = decode_command(command) if isinstance(command, str) else command
+    source = record_identity(record)
+    return [(source, target, dep_kind)
+            for target, dep_kind in record_dependencies(record, vertices_dict)]
+
+
+
+class EdgeStream:
+    """
+    The state of stream_edge_list, for callers that receive the commands of an
+    export one at a time rather than as an iterable (pipeline.py reads them from
+    exporter processes as they arrive).
+
+    Usage:
+        stream = EdgeStream()
+        for source, target, dependency_kind in stream.feed(command):
+            ...
+    """
+
+    def __init__(self):
+        self.vertices_dict = {}
+
+    def feed(self, command):
+        """
+        Decodes one declaration command and returns its edges (source, target,
+        dependency_kind) to the vertices of the commands fed before it.
+        """
+        record = decode_command(command)
+        source = record_identity(record)
+        vertices_dict = self.vertices_dict
+        vertices_dict[(source[0], source[1])] = source
+        edges = []
+        for group, linked_id, slot in _REFERENCES[record.kind](record):
+            target = vertices_dict.get((group, linked_id))
+            if target is not None:
+                edges.append((source, target, slot))
+        return edges
+
+
+def stream_edge_list(commands):
+    """
+    Yields the edges of a sequence of declaration commands in a single pass.
+
+    Lean's export format defines every item before anything refers to it, so a
+    reference can be resolved against the vertices seen so far. Only those
+    vertices are kept, keyed by (group, unique_id); commands are consumed
+    lazily, and each edge (source, target, dependency_kind) is yielded as soon
+    as its line is decoded.
+
+    For a well-formed export the edges equal those of compute_edge_list over the
+    whole file. A forward reference is dropped, and a target whose key repeats
+    carries the label it had when the edge was read.
+    """
+    stream = EdgeStream()
+    for command in commands:
+        yield from stream.feed(command)
+
+# ---------------------------------------------------------------------------
+# Array-backed graph container.
+# ---------------------------------------------------------------------------
+
+# (typecode, numpy descr) of every array a Graph stores.
+_GRAPH_ARRAYS = (
+    ("groups", "B", "|u1"),
+    ("ids", "q", "<i8"),
+    ("kinds", "B", "|u1"),
+    ("offsets", "q", "<i8"),
+    ("targets", "i", "<i4"),
+    ("slot_codes", "H", "<u2"),
+)
+_NPY_TYPECODES = {"|u1": "B", "<i8": "q", "<i4": "i", "<u2": "H"}
+
+
+def _pack_strings(strings):
+    """Packs strings into a UTF-8 byte blob plus an offsets array."""
+    offsets = array.array("q", [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    return array.array("B", blob), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _npy_bytes(values, descr):
+    """Serializes a one-dimensional array in the .npy format (version 1.0)."""
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # Magic (6) + version (2) + header length (2) + header + newline is padded to 64 bytes.
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1") + values.tobytes()
+
+
+def _npy_array(data):
+    """Parses .npy bytes written by _npy_bytes back into an array."""
+    if data[:6] != b"\x93NUMPY":
+        raise ValueError("Not a .npy array.")
+    major = data[6]
+    size_bytes = 2 if major == 1 else 4
+    header_length = int.from_bytes(data[8:8 + size_bytes], "little")
+    start = 8 + size_bytes
+    header = ast.literal_eval(data[start:start + header_length].decode("latin1"))
+    typecode = _NPY_TYPECODES.get(header["descr"])
+    if typecode is None or header["fortran_order"] or len(header["shape"]) != 1:
+        raise ValueError(f"Unsupported .npy array: {header}")
+    values = array.array(typecode)
+    values.frombytes(data[start + header_length:])
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+class _KeyIndex:
+    """
+    The vertex of every key (group, unique_id). Exports number each sequence
+    (names, levels, expressions) densely, so every group gets an array from id
+    to vertex (-1 where there is none), 4 bytes per id instead of a dict entry
+    and a key tuple per vertex. An id far beyond the number of keys so far goes
+    to a dict instead, so sparse ids cannot blow the arrays up.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._sparse = {}
+        self._count = 0
+
+    def get(self, group, unique_id):
+        """Returns the vertex of the key (group, unique_id), or None."""
+        vertices = self._arrays.get(group)
+        if vertices is not None and 0 <= unique_id < len(vertices):
+            v = vertices[unique_id]
+            if v >= 0:
+                return v
+        return self._sparse.get((group, unique_id)) if self._sparse else None
+
+    def set(self, group, unique_id, v):
+        """Records that the key (group, unique_id) is vertex v."""
+        self._count += 1
+        vertices = self._arrays.get(group)
+        if vertices is None:
+            vertices = self._arrays[group] = array.array("i")
+        if 0 <= unique_id < len(vertices):
+            vertices[unique_id] = v
+        elif 0 <= unique_id <= 4 * self._count + 4096:
+            length = max(unique_id + 1, len(vertices) + len(vertices) // 2)
+            vertices.extend(array.array("i", [-1]) * (length - len(vertices)))
+            vertices[unique_id] = v
+        else:
+            self._sparse[(group, unique_id)] = v
+
+    def nbytes(self):
+        """Rough estimate of the memory taken by the index."""
+        total = sum(vertices.itemsize * len(vertices) for vertices in self._arrays.values())
+        return total + sys.getsizeof(self._sparse) + 120 * len(self._sparse)
+
+
+class Graph:
+    """
+    A declaration graph stored as parallel integer arrays.
+
+    Vertices are numbered densely in order of first appearance. For a vertex v:
+       - groups[v] is the group code (an index into GROUPS),
+       - ids[v] is the unique id,
+       - kinds[v] is the kind code (an index into KIND_MARKERS),
+       - labels[v] is the label, stored once per vertex.
+
+    Edges are stored in CSR form: the out-edges of v are the positions
+    offsets[v] to offsets[v + 1] of targets (vertex indices) and slot_codes
+    (indices into slots).
+    """
+
+    def __init__(self, groups, ids, kinds, labels, offsets, targets, slot_codes, slots):
+        self.groups = groups
+        self.ids = ids
+        self.kinds = kinds
+        self.labels = labels
+        self.offsets = offsets
+        self.targets = targets
+        self.slot_codes = slot_codes
+        self.slots = slots
+        self._index = None
+
+    @property
+    def num_vertices(self):
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def index_of(self, group, unique_id):
+        """
+        Returns the vertex index of the key (group, unique_id), or None. The
+        index is built on first use.
+        """
+        if self._index is None:
+            groups, ids = self.groups, self.ids
+            index = _KeyIndex()
+            for v in range(len(ids)):
+                index.set(GROUPS[groups[v]], ids[v], v)
+            self._index = index
+        return self._index.get(group, unique_id)
+
+    def vertex(self, v):
+        """Returns the vertex tuple (group, unique_id, label) of index v."""
+        return (GROUPS[self.groups[v]], self.ids[v], self.labels[v])
+
+    def out_edges(self, v):
+        """Yields the (target index, slot) pairs of the out-edges of v."""
+        targets, slot_codes, slots = self.targets, self.slot_codes, self.slots
+        for e in range(self.offsets[v], self.offsets[v + 1]):
+            yield targets[e], slots[slot_codes[e]]
+
+    def edges(self):
+        """Yields every edge as (source index, target index, slot), in CSR order."""
+        offsets, targets, slot_codes, slots = self.offsets, self.targets, self.slot_codes, self.slots
+        for v in range(len(offsets) - 1):
+            for e in range(offsets[v], offsets[v + 1]):
+                yield v, targets[e], slots[slot_codes[e]]
+
+    def edge_list(self):
+        """Yields every edge as (source, target, dependency_kind) with vertex tuples."""
+        for v, t, slot in self.edges():
+            yield self.vertex(v), self.vertex(t), slot
+
+    def save(self, path):
+        """Saves the graph as an uncompressed .npz archive."""
+        label_blob, label_offsets = _pack_strings(self.labels)
+        slot_blob, slot_offsets = _pack_strings(self.slots)
+        members = [(name, getattr(self, name), descr) for name, _, descr in _GRAPH_ARRAYS]
+        members += [
+            ("label_blob", label_blob, "|u1"),
+            ("label_offsets", label_offsets, "<i8"),
+            ("slot_blob", slot_blob, "|u1"),
+            ("slot_offsets", slot_offsets, "<i8"),
+        ]
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, values, descr in members:
+                archive.writestr(f"{name}.npy", _npy_bytes(values, descr))
+
+    @classmethod
+    def load(cls, path):
+        """Loads a graph saved by Graph.save."""
+        with zipfile.ZipFile(path) as archive:
+            arrays = {name[:-4]: _npy_array(archive.read(name)) for name in archive.namelist()}
+        labels = _unpack_strings(arrays["label_blob"], arrays["label_offsets"])
+        slots = _unpack_strings(arrays["slot_blob"], arrays["slot_offsets"])
+        return cls(arrays["groups"], arrays["ids"], arrays["kinds"], labels,
+                   arrays["offsets"], arrays["targets"], arrays["slot_codes"], slots)
+
+
+def build_graph(records):
+    """
+    Builds a Graph from a sequence of decoded records.
+
+    Both passes run straight over the records, so nothing per line is kept
+    besides the graph being built.
+    """
+    vertex_arrays = _index_vertices((record_identity(record), record.kind) for record in records)
+    return _link_vertices(vertex_arrays,
+                          (((KIND_GROUPS[record.kind], record.unique_id), _REFERENCES[record.kind](record))
+                           for record in records))
+
+
+def assemble_graph(vertices, kinds, references):
+    """
+    Builds a Graph from per-line parts: vertices[i] is the (group, unique_id, label)
+    of line i, kinds[i] its kind code, and the i-th item of references its list of
+    (group, linked_id, slot) triples (see record_references).
+
+    The first pass assigns every key (group, unique_id) a vertex index; when a
+    key repeats, the later line's kind and label win, as with vertices_dict.
+    The second pass resolves references against those keys. References to
+    unknown keys are dropped, as in parse_declaration.
+    """
+    vertex_arrays = _index_vertices(zip(vertices, kinds))
+    return _link_vertices(vertex_arrays,
+                          (((vertex[0], vertex[1]), line_references)
+                           for vertex, line_references in zip(vertices, references)))
+
+
+def _index_vertices(lines):
+    """
+    First pass of build_graph over (vertex, kind code) pairs: returns the key
+    index and the vertex arrays (groups, ids, kinds, labels).
+    """
+    index = _KeyIndex()
+    groups = array.array("B")
+    ids = array.array("q")
+    kind_codes = array.array("B")
+    labels = []
+    for (group, unique_id, label), kind in lines:
+        v = index.get(group, unique_id)
+        if v is None:
+            index.set(group, unique_id, len(ids))
+            groups.append(GROUP_CODES[group])
+            ids.append(unique_id)
+            kind_codes.append(kind)
+            labels.append(label)
+        else:
+            kind_codes[v] = kind
+            labels[v] = label
+    return index, groups, ids, kind_codes, labels
+
+
+def _link_vertices(vertex_arrays, lines):
+    """
+    Second pass of build_graph over (source key, references) pairs: resolves
+    the references and returns the Graph.
+    """
+    index, groups, ids, kind_codes, labels = vertex_arrays
+    slot_index = {}
+    slots = []
+    sources = array.array("i")
+    targets = array.array("i")
+    slot_codes = array.array("H")
+    for (source_group, source_id), line_references in lines:
+        source = index.get(source_group, source_id)
+        for group, linked_id, slot in line_references:
+            target = index.get(group, linked_id)
+            if target is None:
+                continue
+            code = slot_index.get(slot)
+            if code is None:
+                code = slot_index[slot] = len(slots)
+                slots.append(slot)
+            sources.append(source)
+            targets.append(target)
+            slot_codes.append(code)
+
+    # The key index is dropped here; Graph.index_of builds it again if needed.
+    return _csr_graph(groups, ids, kind_codes, labels, sources, targets, slot_codes, slots)
+
+
+def _csr_graph(groups, ids, kind_codes, labels, sources, targets, slot_codes, slots):
+    """
+    Builds a Graph from its vertex arrays and its edges in line order, given
+    as parallel arrays of sources, targets and slot codes.
+    """
+    # Edges come out grouped by source unless a key repeats; a stable
+    # counting sort restores CSR order in that case.
+    counts = array.array("q", bytes(8 * (len(ids) + 1)))
+    for source in sources:
+        counts[source + 1] += 1
+    offsets = counts
+    for v in range(len(ids)):
+        offsets[v + 1] += offsets[v]
+    if any(sources[e] > sources[e + 1] for e in range(len(sources) - 1)):
+        fill = array.array("q", offsets)
+        sorted_targets = array.array("i", bytes(4 * len(targets)))
+        sorted_slot_codes = array.array("H", bytes(2 * len(slot_codes)))
+        for e, source in enumerate(sources):
+            position = fill[source]
+            sorted_targets[position] = targets[e]
+            sorted_slot_codes[position] = slot_codes[e]
+            fill[source] += 1
+        targets, slot_codes = sorted_targets, sorted_slot_codes
+    return Graph(groups, ids, kind_codes, labels, offsets, targets, slot_codes, slots)
+
+
+# ---------------------------------------------------------------------------
+# Binary, memory-mappable graph file.
+#
+# Layout (all integers little-endian, every section 8-byte aligned):
+#   header          magic, version, then vertex count, edge count and the byte
+#                   offsets of the sections below (_BINARY_HEADER)
+#   edges           num_edges records of (source u32, target u32, slot code u32)
+#   ids             num_vertices i64
+#   groups          num_vertices u8 (indices into GROUPS)
+#   kinds           num_vertices u8 (indices into KIND_MARKERS)
+#   label offsets   num_vertices + 1 u64 into the label blob
+#   label blob      UTF-8 labels, concatenated
+#   slot offsets    num_slots + 1 u64 into the slot blob
+#   slot blob       UTF-8 slot names, concatenated
+# ---------------------------------------------------------------------------
+
+BINARY_MAGIC = b"LEANGRPH"
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<8sII10Q")
+_BINARY_SECTIONS = ("edges", "ids", "groups", "kinds", "label_offsets",
+                    "label_blob", "slot_offsets", "slot_blob")
+
+
+def _little_endian_bytes(values):
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_binary_graph(graph, path):
+    """
+    Writes a Graph as a binary file that BinaryGraph can memory-map.
+
+    Edges are stored in CSR order as fixed-width (source, target, slot code)
+    records; the vertex and label tables follow in their own sections.
+    """
+    edges = array.array("I", bytes(12 * graph.num_edges))
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    for v in range(graph.num_vertices):
+        for e in range(offsets[v], offsets[v + 1]):
+            edges[3 * e] = v
+            edges[3 * e + 1] = targets[e]
+            edges[3 * e + 2] = slot_codes[e]
+    label_blob, label_offsets = _pack_strings(graph.labels)
+    slot_blob, slot_offsets = _pack_strings(graph.slots)
+    sections = [edges, graph.ids, graph.groups, graph.kinds,
+                label_offsets, label_blob, slot_offsets, slot_blob]
+
+    position = _BINARY_HEADER.size
+    starts = []
+    for values in sections:
+        position += -position % 8
+        starts.append(position)
+        position += len(values) * values.itemsize
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(graph.slots),
+                                 graph.num_vertices, graph.num_edges, *starts)
+    with open(path, "wb") as file:
+        file.write(header)
+        for start, values in zip(starts, sections):
+            file.write(bytes(start - file.tell()))
+            file.write(_little_endian_bytes(values))
+
+
+class BinaryGraph:
+    """
+    A read-only view of a file written by write_binary_graph.
+
+    The file is memory-mapped and nothing is parsed up front: edges is a flat
+    view of the edge records (edge e occupies positions 3e, 3e + 1 and 3e + 2),
+    and sources, targets and slot_codes are strided views over it. ids, groups
+    and kinds are views over the vertex table; labels are decoded on access.
+    On a big-endian host the integer sections are copied into byte-swapped
+    arrays instead of being viewed in place.
+
+    Use as a context manager, or call close(), to release the mapping.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = _BINARY_HEADER.unpack_from(self._mmap, 0)
+        magic, version, num_slots, num_vertices, num_edges = fields[:5]
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} binary graph.")
+        self.num_vertices = num_vertices
+        self.num_edges = num_edges
+        starts = dict(zip(_BINARY_SECTIONS, fields[5:]))
+        view = memoryview(self._mmap)
+        self._views = [view]
+
+        def section(name, typecode, count):
+            start = starts[name]
+            size = array.array(typecode).itemsize
+            values = view[start:start + count * size]
+            self._views.append(values)
+            if sys.byteorder == "big" and size > 1:
+                copy = array.array(typecode, values.tobytes())
+                copy.byteswap()
+                return copy
+            values = values.cast(typecode)
+            self._views.append(values)
+            return values
+
+        self.edges = section("edges", "I", 3 * num_edges)
+        self.sources = self.edges[0::3]
+        self.targets = self.edges[1::3]
+        self.slot_codes = self.edges[2::3]
+        self.ids = section("ids", "q", num_vertices)
+        self.groups = section("groups", "B", num_vertices)
+        self.kinds = section("kinds", "B", num_vertices)
+        self._label_offsets = section("label_offsets", "Q", num_vertices + 1)
+        self._label_blob = section("label_blob", "B", self._label_offsets[num_vertices])
+        slot_offsets = section("slot_offsets", "Q", num_slots + 1)
+        slot_blob = section("slot_blob", "B", slot_offsets[num_slots]).tobytes()
+        self.slots = [slot_blob[slot_offsets[i]:slot_offsets[i + 1]].decode("utf-8")
+                      for i in range(num_slots)]
+        if isinstance(self.edges, memoryview):
+            self._views += [self.sources, self.targets, self.slot_codes]
+
+    def label(self, v):
+        """Returns the label of vertex v."""
+        start, end = self._label_offsets[v], self._label_offsets[v + 1]
+        return self._label_blob[start:end].tobytes().decode("utf-8")
+
+    def vertex(self, v):
+        """Returns the vertex tuple (group, unique_id, label) of index v."""
+        return (GROUPS[self.groups[v]], self.ids[v], self.label(v))
+
+    def edge(self, e):
+        """Returns edge e as (source index, target index, slot)."""
+        edges = self.edges
+        return edges[3 * e], edges[3 * e + 1], self.slots[edges[3 * e + 2]]
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# Passes over a Graph.
+# ---------------------------------------------------------------------------
+
+def topological_order(graph):
+    """
+    Returns the vertex indices of a Graph with every vertex after all of its
+    dependents (children first), computed without recursion.
+
+    Exports define every item before it is referenced, so vertex order already
+    qualifies unless the export has forward references; only then is an
+    iterative depth-first search run. Raises ValueError on a cycle.
+    """
+    offsets, targets = graph.offsets, graph.targets
+    n = graph.num_vertices
+    if all(targets[e] < v for v in range(n) for e in range(offsets[v], offsets[v + 1])):
+        return range(n)
+
+    # state: 0 = unvisited, 1 = on the stack, 2 = finished.
+    state = bytearray(n)
+    order = array.array("i")
+    for root in range(n):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, offsets[root])]
+        while stack:
+            v, e = stack[-1]
+            if e == offsets[v + 1]:
+                stack.pop()
+                state[v] = 2
+                order.append(v)
+                continue
+            stack[-1] = (v, e + 1)
+            t = targets[e]
+            if state[t] == 0:
+                state[t] = 1
+                stack.append((t, offsets[t]))
+            elif state[t] == 1:
+                raise ValueError("The declaration graph has a cycle.")
+    return order
+
+
+# Kinds whose label suffix is literal data (a name component, a binder, an
+# index or a literal value) rather than a list of local ids.
+_LITERAL_KINDS = frozenset(KIND_CODES[marker] for marker in
+                           ("#NS", "#NI", "#EV", "#EL", "#EP", "#EJ", "#ELN", "#ELS"))
+
+
+def group_g_references(graph, records):
+    """
+    Lists the references of the records that the graph has no edge for: a group
+    C reference to an #EJ/#ELN/#ELS/#EZ, which share the expression numbering
+    but are keyed in group G, resolves in group G.
+
+    records are the decoded records the graph was built from, in any order.
+    Returns {vertex: [(slot, target vertex), ...]} with every reference of each
+    such vertex, in slot order; few vertices have one, so the result is small
+    and the records can be dropped once it is built.
+    """
+    rewired = {}
+    for record in records:
+        line_references = _REFERENCES[record.kind](record)
+        if not any(group == "C" and graph.index_of("C", linked_id) is None
+                   and graph.index_of("G", linked_id) is not None
+                   for group, linked_id, _ in line_references):
+            continue
+        resolved = []
+        for group, linked_id, slot in line_references:
+            t = graph.index_of(group, linked_id)
+            if t is None and group == "C":
+                t = graph.index_of("G", linked_id)
+            if t is not None:
+                resolved.append((slot, t))
+        rewired[graph.index_of(KIND_GROUPS[record.kind], record.unique_id)] = resolved
+    return rewired
+
+
+def structural_hashes(graph, rewired, digest_size=16):
+    """
+    Computes a content-addressed (Merkle-style) hash for every vertex of a Graph.
+
+    The hash of a vertex covers its kind marker, its literal payload and the
+    (slot, hash) pairs of its references, never its local unique_id, so equal
+    subterms get equal hashes within and across exports, and subterms that
+    differ anywhere, down to a literal, get different ones. #DEF/#AX/#IND
+    vertices also cover the hash of the name they are keyed by. Vertices are
+    processed children first, without recursion.
+
+    rewired (from group_g_references) supplies the references the graph has no
+    edge for; the other references are the graph's edges.
+
+    Equal subterms can then be found in constant time by keying a dictionary on
+    the returned digests.
+
+    The literal payload is read from the labels, so the graph must still carry
+    the labels assigned by build_graph.
+
+    Returns a list of digests (bytes), indexed by vertex.
+    """
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    groups, ids, kinds, labels = graph.groups, graph.ids, graph.kinds, graph.labels
+    n = graph.num_vertices
+    slots = [slot.encode("utf-8") for slot in graph.slots]
+    markers = [marker.encode("ascii") for marker in KIND_MARKERS]
+    declaration_groups = (GROUP_CODES["D"], GROUP_CODES["E"])
+    rewired = {v: [(slot.encode("utf-8"), t) for slot, t in references] for v, references in rewired.items()}
+
+    def references(v):
+        if v in rewired:
+            return rewired[v]
+        return [(slots[slot_codes[e]], targets[e]) for e in range(offsets[v], offsets[v + 1])]
+
+    if rewired:
+        # state: 0 = unvisited, 1 = on the stack, 2 = finished.
+        state = bytearray(n)
+        order = array.array("i")
+        for root in range(n):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, iter(references(root)))]
+            while stack:
+                v, pending = stack[-1]
+                for _, t in pending:
+                    if state[t] == 0:
+                        state[t] = 1
+                        stack.append((t, iter(references(t))))
+                        break
+                    if state[t] == 1:
+                        raise ValueError("The declaration graph has a cycle.")
+                else:
+                    stack.pop()
+                    state[v] = 2
+                    order.append(v)
+    else:
+        order = topological_order(graph)
+    # Nothing refers to a declaration, so declarations go last, after the names
+    # they are keyed by.
+    order = ([v for v in order if groups[v] not in declaration_groups]
+             + [v for v in range(n) if groups[v] in declaration_groups])
+
+    hashes = [None] * n
+    for v in order:
+        digest = hashlib.blake2b(markers[kinds[v]], digest_size=digest_size)
+        digest.update(b"\0")
+        if kinds[v] in _LITERAL_KINDS:
+            prefix_length = len(GROUPS[groups[v]]) + len(str(ids[v])) + 2
+            digest.update(labels[v][prefix_length:].encode("utf-8"))
+        elif groups[v] in declaration_groups:
+            name = graph.index_of("A", ids[v])
+            if name is not None:
+                digest.update(b"\0name\0")
+                digest.update(hashes[name])
+        for slot, t in references(v):
+            digest.update(b"\0")
+            digest.update(slot)
+            digest.update(b"\0")
+            digest.update(hashes[t])
+        hashes[v] = digest.digest()
+    return hashes
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import base
+import compressed
+import main
+
+"""
+This is the batch I/O module.
+It walks a directory tree of exports (*.txt, laid out like Example Exports/), converts
+every export into its graph CSV in a pool of worker processes, and records the timing
+and size of every conversion in a JSON manifest. The largest exports are scheduled
+first so that a long export does not start last and hold up the whole batch. Exports
+whose manifest entry matches their current size and modification time, and whose
+output still exists, are skipped.
+
+Usage:
+    python3 batch.py <ExportDirectory> [--output-dir DIR] [--jobs N] [--force]
+"""
+
+MANIFEST_NAME = "manifest.json"
+
+
+def find_exports(root):
+    """Returns the paths of every *.txt file (possibly compressed) under root, sorted."""
+    exports = []
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if compressed.strip_compression(file_name).endswith(".txt"):
+                exports.append(os.path.join(directory, file_name))
+    return sorted(exports)
+
+
+def output_path_for(export_path, root, output_dir=None):
+    """
+    The CSV path of an export: next to it (Nat.gcd_self.txt -> Nat.gcd_self.csv),
+    or at the same relative position under output_dir.
+    """
+    stem = os.path.splitext(compressed.strip_compression(export_path))[0]
+    if output_dir is None:
+        return stem + ".csv"
+    return os.path.join(output_dir, os.path.relpath(stem, root) + ".csv")
+
+
+def convert_export(export_path, output_path):
+    """
+    Converts one export into its graph CSV.
+
+    Returns a manifest entry with the vertex and edge counts and the time taken,
+    or with an "error" field if the export could not be converted.
+    """
+    started = time.perf_counter()
+    try:
+        with compressed.input_file(export_path) as file:
+            records = [base.decode_command(command)
+                       for command in (line.strip() for line in file) if command]
+        graph = base.build_graph(records)
+        del records
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        main.write_graph_csv(graph, output_path)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "seconds": time.perf_counter() - started}
+    return {
+        "vertices": graph.num_vertices,
+        "edges": graph.num_edges,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, path):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def is_up_to_date(entry, stat, output_path):
+    return (entry is not None
+            and "error" not in entry
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and os.path.exists(output_path))
+
+
+def run_batch(root, output_dir=None, jobs=None, force=False, save_every=100):
+    """
+    Converts every export under root and returns the manifest.
+
+    The manifest is stored as manifest.json in output_dir (or in root) and maps
+    the path of each export, relative to root, to its entry.
+    """
+    manifest_path = os.path.join(output_dir or root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    pending = []
+    for export_path in find_exports(root):
+        stat = os.stat(export_path)
+        output_path = output_path_for(export_path, root, output_dir)
+        name = os.path.relpath(export_path, root)
+        if not force and is_up_to_date(manifest.get(name), stat, output_path):
+            continue
+        pending.append((stat.st_size, stat.st_mtime_ns, name, export_path, output_path))
+    # Largest first: the long exports overlap with all the short ones.
+    pending.sort(key=lambda item: item[0], reverse=True)
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    completed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(convert_export, export_path, output_path): (size, mtime_ns, name, output_path)
+                       for size, mtime_ns, name, export_path, output_path in pending}
+            for future in as_completed(futures):
+                size, mtime_ns, name, output_path = futures[future]
+                entry = future.result()
+                entry.update(size=size, mtime_ns=mtime_ns, output=os.path.relpath(output_path, output_dir or root))
+                manifest[name] = entry
+                if "error" in entry:
+                    print(f"Error: {name}: {entry['error']}")
+                completed += 1
+                if completed % save_every == 0:
+                    save_manifest(manifest, manifest_path)
+    finally:
+        save_manifest(manifest, manifest_path)
+    return manifest
+
+
+def main_batch():
+    parser = argparse.ArgumentParser(description="Converts every Lean export under a directory into a graph CSV.")
+    parser.add_argument("root", help="directory tree of *.txt exports")
+    parser.add_argument("--output-dir", metavar="DIR",
+                        help="write outputs (and the manifest) under DIR instead of next to the inputs")
+    parser.add_argument("--jobs", type=int, metavar="N", help="number of worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="reconvert exports that are up to date")
+    args = parser.parse_args()
+    if not os.path.isdir(args.root):
+        print(f"Error: Directory not found at path {args.root}")
+        sys.exit(1)
+    run_batch(args.root, args.output_dir, args.jobs, args.force)
+
+
+if __name__ == "__main__":
+    main_batch()
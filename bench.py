@@ -0,0 +1,208 @@
+import argparse
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+import base
+import main
+import synth
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+"""
+This is the benchmark module.
+It times each stage of the pipeline in main.py separately on one export, either the
+checked-in Nat.gcd_self fixture or a synthetic export from synth.py, and reports lines/s,
+edges/s and the peak RSS of the process after each stage. Stages run in pipeline order,
+so a jump in peak RSS belongs to the stage that reports it.
+
+On the fixture, the CSV written by the pipeline is compared against the checked-in
+Nat.gcd_self.csv. A saved report can serve as a baseline: any stage whose throughput
+falls by more than the tolerance makes the run exit with status 1.
+
+Usage:
+    python3 bench.py [--lines N | --input PATH] [--repeat R] [--save PATH] [--baseline PATH]
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(HERE, "Example Exports", "Nat.gcd_self", "Nat.gcd_self.txt")
+FIXTURE_CSV = os.path.join(HERE, "Example Exports", "Nat.gcd_self", "Nat.gcd_self.csv")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _best_time(stage, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = stage()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmark(path, repeat=1, expected_csv=None):
+    """
+    Benchmarks the stages of the pipeline on the export at path.
+
+    Returns a report: {"input", "lines", "edges", "stages": [...], "csv_matches",
+    "hashes_distinct"},
+    where every stage has its name, seconds (best of repeat), lines_per_second,
+    edges_per_second (for stages that produce or write edges) and peak_rss_mb.
+    csv_matches and hashes_distinct (see literal_applications_distinct) are None
+    unless expected_csv is given.
+    """
+    stages = []
+
+    def record(name, seconds, lines, edges=None):
+        stages.append({
+            "name": name,
+            "seconds": seconds,
+            "lines_per_second": lines / seconds if seconds else None,
+            "edges_per_second": edges / seconds if edges is not None and seconds else None,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+
+    seconds, commands = _best_time(lambda: main.parse_declaration_commands(path), repeat)
+    lines = len(commands)
+    record("parse_declaration_commands", seconds, lines)
+
+    def identities():
+        vertices_dict = {}
+        for command in commands:
+            vertex = base.compute_identity(command)
+            vertices_dict[(vertex[0], vertex[1])] = vertex
+        return vertices_dict
+    seconds, vertices_dict = _best_time(identities, repeat)
+    record("compute_identity", seconds, lines)
+
+    def dependencies():
+        return sum(len(base.parse_declaration(command, vertices_dict)) for command in commands)
+    seconds, edges = _best_time(dependencies, repeat)
+    record("parse_declaration", seconds, lines, edges)
+    del vertices_dict
+
+    seconds, graph = _best_time(
+        lambda: base.build_graph([base.decode_command(command) for command in commands]), repeat)
+    record("build_graph", seconds, lines, graph.num_edges)
+
+    records = [base.decode_command(command) for command in commands]
+    del commands
+    rewired = base.group_g_references(graph, records)
+    seconds, hashes = _best_time(lambda: base.structural_hashes(graph, rewired), repeat)
+    record("structural_hashes", seconds, lines, graph.num_edges)
+    hashes_distinct = literal_applications_distinct(graph, records, hashes) if expected_csv is not None else None
+    del records, hashes
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "graph.csv")
+        seconds, _ = _best_time(lambda: main.write_graph_csv(graph, csv_path), repeat)
+        record("write_graph_csv", seconds, lines, graph.num_edges)
+        csv_matches = None
+        if expected_csv is not None:
+            csv_matches = filecmp.cmp(csv_path, expected_csv, shallow=False)
+
+    return {"input": path, "lines": lines, "edges": edges, "stages": stages, "csv_matches": csv_matches,
+            "hashes_distinct": hashes_distinct}
+
+
+def literal_applications_distinct(graph, records, hashes):
+    """
+    Whether every two applications (#EA) of the same function to different
+    literals (#ELN, #ELS) got different structural hashes.
+    """
+    literal_kinds = (base.KIND_CODES["#ELN"], base.KIND_CODES["#ELS"])
+    literals = {}
+    for record in records:
+        if record.kind != base.KIND_CODES["#EA"]:
+            continue
+        head = graph.index_of("C", record.operands[0])
+        argument = graph.index_of("G", record.operands[1])
+        if head is None or argument is None or graph.kinds[argument] not in literal_kinds:
+            continue
+        literal = graph.labels[argument].split("_", 2)[2]
+        key = (hashes[head], hashes[graph.index_of("C", record.unique_id)])
+        if literals.setdefault(key, literal) != literal:
+            return False
+    return True
+
+
+def regressions(report, baseline, tolerance):
+    """Names of the stages whose lines/s fell by more than tolerance against baseline."""
+    previous = {stage["name"]: stage["lines_per_second"] for stage in baseline["stages"]}
+    slower = []
+    for stage in report["stages"]:
+        before = previous.get(stage["name"])
+        if before and stage["lines_per_second"] < before * (1 - tolerance):
+            slower.append(stage["name"])
+    return slower
+
+
+def print_report(report):
+    print(f"{report['input']}: {report['lines']} lines, {report['edges']} edges")
+    print(f"{'stage':<28}{'seconds':>10}{'lines/s':>14}{'edges/s':>14}{'peak RSS MB':>14}")
+    for stage in report["stages"]:
+        edges_per_second = stage["edges_per_second"]
+        rss = stage["peak_rss_mb"]
+        print(f"{stage['name']:<28}{stage['seconds']:>10.3f}{stage['lines_per_second'] or 0:>14,.0f}"
+              f"{'' if edges_per_second is None else format(edges_per_second, ',.0f'):>14}"
+              f"{'' if rss is None else format(rss, '.1f'):>14}")
+    if report["csv_matches"] is not None:
+        print("graph.csv matches the checked-in CSV" if report["csv_matches"]
+              else "graph.csv DIFFERS from the checked-in CSV")
+    if report["hashes_distinct"] is not None:
+        print("structural hashes tell literal arguments apart" if report["hashes_distinct"]
+              else "structural hashes MERGE applications to different literals")
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Benchmarks the export-to-graph pipeline.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--input", metavar="PATH", help="export to benchmark (default: the Nat.gcd_self fixture)")
+    source.add_argument("--lines", type=float, help="benchmark a synthetic export of this many lines, e.g. 1e7")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic export")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of R runs of each stage")
+    parser.add_argument("--save", metavar="PATH", help="write the report as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a report saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed fractional drop in lines/s against the baseline (default: 0.2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.lines is not None:
+            path = os.path.join(directory, "Export.txt")
+            synth.write_export(path, int(args.lines), args.seed)
+            report = run_benchmark(path, args.repeat)
+        else:
+            path = args.input or FIXTURE
+            report = run_benchmark(path, args.repeat, FIXTURE_CSV if path == FIXTURE else None)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=1)
+    failed = report["csv_matches"] is False or report["hashes_distinct"] is False
+    if args.baseline:
+        with open(args.baseline) as file:
+            slower = regressions(report, json.load(file), args.tolerance)
+        for name in slower:
+            print(f"Regression: {name} is more than {args.tolerance:.0%} slower than the baseline")
+        failed = failed or bool(slower)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,314 @@
+import array
+import hashlib
+import os
+import tempfile
+import zipfile
+import base
+
+"""
+This is the incremental cache module.
+Exports of different theorems from the same imports share long identical prefixes.
+The cache splits the declaration commands into fixed-size chunks of lines and stores,
+for every chunk, its part of the resolved graph: the vertices it adds, the kinds and
+labels it overwrites, its edges as vertex indices, and the slot names it introduces.
+Vertex indices depend on everything before the chunk, so a chunk is keyed by a hash that
+chains the key of the previous chunk with its own content: an entry stands for the
+whole prefix up to its chunk. A run loads the entries of the longest cached prefix and
+only decodes and resolves the lines after it; a fully cached export decodes nothing.
+
+A reference to a key not defined yet when its chunk is resolved is kept aside with its
+key; the chunk that defines the key records it, and it is inserted at its place in line
+order once the whole export is loaded, as base.build_graph would have resolved it.
+
+Entries are .npz archives of plain arrays (see base.Graph.save), one file each; the cache
+is capped in size and evicts the least recently used entries (by modification time,
+which is refreshed on every hit).
+"""
+
+CACHE_VERSION = 2
+DEFAULT_CHUNK_LINES = 4096
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Members of an entry and their .npy dtypes. A pending reference (its key is not
+# defined yet) goes before the chunk edge at its position in pending; late maps
+# the numbers of earlier pending references to the vertices this chunk defines.
+_ENTRY_MEMBERS = (
+    ("groups", "|u1"),
+    ("ids", "<i8"),
+    ("kinds", "|u1"),
+    ("label_blob", "|u1"),
+    ("label_offsets", "<i8"),
+    ("updated", "<i4"),
+    ("updated_kinds", "|u1"),
+    ("updated_label_blob", "|u1"),
+    ("updated_label_offsets", "<i8"),
+    ("sources", "<i4"),
+    ("targets", "<i4"),
+    ("slot_codes", "<u2"),
+    ("slot_blob", "|u1"),
+    ("slot_offsets", "<i8"),
+    ("pending", "<i8"),
+    ("pending_sources", "<i4"),
+    ("pending_groups", "|u1"),
+    ("pending_ids", "<i8"),
+    ("pending_slot_blob", "|u1"),
+    ("pending_slot_offsets", "<i8"),
+    ("late", "<i8"),
+    ("late_targets", "<i4"),
+)
+
+
+class ExportCache:
+    """
+    An on-disk cache of per-chunk graph building results.
+
+    Parameters:
+        directory (str): Where cache entries are stored; created if missing.
+        max_bytes (int): Size cap of the cache directory.
+        chunk_lines (int): Number of declaration commands per chunk.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, chunk_lines=DEFAULT_CHUNK_LINES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_lines = chunk_lines
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _chunk_keys(self, commands):
+        """Returns the chained key of every chunk of commands."""
+        keys = []
+        key = f"v{CACHE_VERSION}:{self.chunk_lines}"
+        for start in range(0, len(commands), self.chunk_lines):
+            digest = hashlib.sha256(key.encode())
+            for command in commands[start:start + self.chunk_lines]:
+                digest.update(command.encode("utf-8"))
+                digest.update(b"\n")
+            key = digest.hexdigest()
+            keys.append(key)
+        return keys
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _load(self, path):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                entry = {name: base._npy_array(archive.read(f"{name}.npy")) for name, _ in _ENTRY_MEMBERS}
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        os.utime(path)
+        return entry
+
+    def _store(self, path, entry):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as file, \
+                zipfile.ZipFile(file, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, descr in _ENTRY_MEMBERS:
+                archive.writestr(f"{name}.npy", base._npy_bytes(entry[name], descr))
+        os.replace(temporary, path)
+
+    def build_graph(self, commands):
+        """
+        Builds the base.Graph of a sequence of declaration commands, loading the
+        chunks of its longest cached prefix and resolving the rest.
+        """
+        keys = self._chunk_keys(commands)
+        graph = _GraphParts()
+        cached = 0
+        for key in keys:
+            entry = self._load(self._path(key))
+            if entry is None:
+                break
+            graph.add(entry)
+            cached += 1
+        self.hits += cached
+        self.misses += len(keys) - cached
+
+        if cached < len(keys):
+            index, slot_index, pending_keys = graph.key_index(), graph.slot_index(), graph.pending_keys()
+            for number in range(cached, len(keys)):
+                start = number * self.chunk_lines
+                chunk = commands[start:start + self.chunk_lines]
+                entry = _resolve_chunk(chunk, index, len(graph.ids), slot_index, pending_keys, len(graph.pending))
+                self._store(self._path(keys[number]), entry)
+                graph.add(entry)
+            self.evict()
+        return graph.finish()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _resolve_chunk(chunk, index, vertex_count, slot_index, pending_keys, pending_count):
+    """
+    Decodes and resolves one chunk of commands against the keys of everything
+    before it, updating index (a base._KeyIndex), slot_index (slot -> code)
+    and pending_keys (key -> numbers of the pending references to it; the
+    references pending so far number pending_count). Returns its entry.
+    """
+    records = [base.decode_command(command) for command in chunk]
+    groups, ids, kinds, labels = array.array("B"), array.array("q"), array.array("B"), []
+    updated, updated_kinds, updated_labels = array.array("i"), array.array("B"), []
+    late, late_targets = array.array("q"), array.array("i")
+    line_vertices = []
+    for record in records:
+        group, unique_id, label = base.record_identity(record)
+        v = index.get(group, unique_id)
+        if v is None:
+            v = vertex_count + len(ids)
+            index.set(group, unique_id, v)
+            groups.append(base.GROUP_CODES[group])
+            ids.append(unique_id)
+            kinds.append(record.kind)
+            labels.append(label)
+            for number in pending_keys.pop((group, unique_id), ()):
+                late.append(number)
+                late_targets.append(v)
+        elif v >= vertex_count:
+            kinds[v - vertex_count] = record.kind
+            labels[v - vertex_count] = label
+        else:
+            updated.append(v)
+            updated_kinds.append(record.kind)
+            updated_labels.append(label)
+        line_vertices.append(v)
+
+    sources, targets, slot_codes, slots = array.array("i"), array.array("i"), array.array("H"), []
+    pending, pending_sources, pending_groups, pending_ids, pending_slots = (
+        array.array("q"), array.array("i"), array.array("B"), array.array("q"), [])
+    for record, source in zip(records, line_vertices):
+        for group, linked_id, slot in base.record_references(record):
+            target = index.get(group, linked_id)
+            if target is None:
+                pending_keys.setdefault((group, linked_id), []).append(pending_count + len(pending))
+                pending.append(len(targets))
+                pending_sources.append(source)
+                pending_groups.append(base.GROUP_CODES[group])
+                pending_ids.append(linked_id)
+                pending_slots.append(slot)
+                continue
+            code = slot_index.get(slot)
+            if code is None:
+                code = slot_index[slot] = len(slot_index)
+                slots.append(slot)
+            sources.append(source)
+            targets.append(target)
+            slot_codes.append(code)
+
+    label_blob, label_offsets = base._pack_strings(labels)
+    updated_label_blob, updated_label_offsets = base._pack_strings(updated_labels)
+    slot_blob, slot_offsets = base._pack_strings(slots)
+    pending_slot_blob, pending_slot_offsets = base._pack_strings(pending_slots)
+    return {"groups": groups, "ids": ids, "kinds": kinds,
+            "label_blob": label_blob, "label_offsets": label_offsets,
+            "updated": updated, "updated_kinds": updated_kinds,
+            "updated_label_blob": updated_label_blob, "updated_label_offsets": updated_label_offsets,
+            "sources": sources, "targets": targets, "slot_codes": slot_codes,
+            "slot_blob": slot_blob, "slot_offsets": slot_offsets,
+            "pending": pending, "pending_sources": pending_sources,
+            "pending_groups": pending_groups, "pending_ids": pending_ids,
+            "pending_slot_blob": pending_slot_blob, "pending_slot_offsets": pending_slot_offsets,
+            "late": late, "late_targets": late_targets}
+
+
+class _GraphParts:
+    """The vertex and edge arrays of a graph, concatenated from entries in order."""
+
+    def __init__(self):
+        self.groups = array.array("B")
+        self.ids = array.array("q")
+        self.kinds = array.array("B")
+        self.labels = []
+        self.sources = array.array("i")
+        self.targets = array.array("i")
+        self.slot_codes = array.array("H")
+        self.slots = []
+        self.pending = []  # (edge position, source, group, unique_id, slot)
+        self.late = {}  # pending reference number -> target
+
+    def add(self, entry):
+        edge_count = len(self.targets)
+        self.groups += entry["groups"]
+        self.ids += entry["ids"]
+        self.kinds += entry["kinds"]
+        self.labels += base._unpack_strings(entry["label_blob"], entry["label_offsets"])
+        updated_labels = base._unpack_strings(entry["updated_label_blob"], entry["updated_label_offsets"])
+        for v, kind, label in zip(entry["updated"], entry["updated_kinds"], updated_labels):
+            self.kinds[v] = kind
+            self.labels[v] = label
+        self.sources += entry["sources"]
+        self.targets += entry["targets"]
+        self.slot_codes += entry["slot_codes"]
+        self.slots += base._unpack_strings(entry["slot_blob"], entry["slot_offsets"])
+        if entry["pending"]:
+            pending_slots = base._unpack_strings(entry["pending_slot_blob"], entry["pending_slot_offsets"])
+            self.pending += ((edge_count + e, source, base.GROUPS[group], unique_id, slot)
+                             for e, source, group, unique_id, slot
+                             in zip(entry["pending"], entry["pending_sources"], entry["pending_groups"],
+                                    entry["pending_ids"], pending_slots))
+        self.late.update(zip(entry["late"], entry["late_targets"]))
+
+    def key_index(self):
+        index = base._KeyIndex()
+        groups, ids = self.groups, self.ids
+        for v in range(len(ids)):
+            index.set(base.GROUPS[groups[v]], ids[v], v)
+        return index
+
+    def slot_index(self):
+        return {slot: code for code, slot in enumerate(self.slots)}
+
+    def pending_keys(self):
+        keys = {}
+        for number, (_, _, group, unique_id, _) in enumerate(self.pending):
+            if number not in self.late:
+                keys.setdefault((group, unique_id), []).append(number)
+        return keys
+
+    def finish(self):
+        """Inserts the references resolved late and returns the base.Graph."""
+        sources, targets, slot_codes, slots = self.sources, self.targets, self.slot_codes, self.slots
+        if self.late:
+            # Each late edge goes before the edge at its position, and the slots
+            # are numbered in order of first use, as base.build_graph does.
+            late = sorted((self.pending[number][0], number) for number in self.late)
+            edges = []
+            next_late = 0
+            for e in range(len(targets) + 1):
+                while next_late < len(late) and late[next_late][0] == e:
+                    number = late[next_late][1]
+                    _, source, _, _, slot = self.pending[number]
+                    edges.append((source, self.late[number], slot))
+                    next_late += 1
+                if e < len(targets):
+                    edges.append((sources[e], targets[e], self.slots[slot_codes[e]]))
+            slot_index = {}
+            sources, targets, slot_codes = array.array("i"), array.array("i"), array.array("H")
+            for source, target, slot in edges:
+                sources.append(source)
+                targets.append(target)
+                slot_codes.append(slot_index.setdefault(slot, len(slot_index)))
+            slots = list(slot_index)
+        return base._csr_graph(self.groups, self.ids, self.kinds, self.labels,
+                               sources, targets, slot_codes, slots)
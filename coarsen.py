@@ -0,0 +1,156 @@
+import array
+import csv
+import base
+import compressed
+
+"""
+This is the coarsening module.
+It shrinks a base.Graph (the edges of base.compute_edge_list) to a size a browser can lay
+out, in two modes:
+   - coarsen_terms merges expression chains into super-vertices: an #EA whose only parent
+     applies it (slot n0 of an #EA) belongs to that parent's application spine, and an
+     #EL/#EP whose only parent is a binder of the same kind binding it as the body (slot
+     n2) belongs to that parent's binder chain. Names are folded away: the labels carry
+     dotted full names (names.full_name_labels), and the #NS/#NI vertices and every edge
+     into them are dropped. A spine or chain is named after its outermost vertex.
+     Vertices with several parents stay on their own, so shared subterms stay shared.
+     This shrinks a graph by less than half (26680 edges to 15631 for Nat.gcd_self): a
+     view of the term structure, not a graph small enough to lay out whole, which only
+     declaration_edges gives.
+   - declaration_edges keeps only the top-level declarations (#DEF, #AX, #IND): an edge
+     d -> e for every constant (#EC) in d's type or value that names e or, for an #IND,
+     one of its constructors. Its weight is the number of such constants.
+
+Edges between the same super-vertices with the same dependency kind are merged, and the
+weight column counts the original edges. coarsen_terms is a single pass over the edges in
+base.topological_order. declaration_edges walks each declaration's type and value once,
+with a stamp per vertex instead of a visited set per declaration; a subterm shared by
+several declarations is visited once for each of them, so the cost is the total size of
+the per-declaration subgraphs, about 1.5 times the number of edges in real exports.
+"""
+
+DECLARATION_KIND = "declaration"
+
+_APPLICATION = base.KIND_CODES["#EA"]
+_BINDERS = (base.KIND_CODES["#EL"], base.KIND_CODES["#EP"])
+_NAME_KINDS = (base.KIND_CODES["#NS"], base.KIND_CODES["#NI"])
+_DECLARATION_GROUPS = (base.GROUP_CODES["D"], base.GROUP_CODES["E"])
+_EXPRESSION_GROUPS = (base.GROUP_CODES["C"], base.GROUP_CODES["G"])
+_CONSTANT = base.KIND_CODES["#EC"]
+
+
+def coarsen_terms(graph):
+    """
+    Returns the weighted edges (source, target, slot, weight) between the
+    super-vertices of a base.Graph, as vertex indices of their outermost vertex.
+    """
+    n = graph.num_vertices
+    offsets, targets, slot_codes, kinds = graph.offsets, graph.targets, graph.slot_codes, graph.kinds
+    slot_n0 = graph.slots.index("n0") if "n0" in graph.slots else -1
+    slot_n2 = graph.slots.index("n2") if "n2" in graph.slots else -1
+
+    in_degree = array.array("q", bytes(8 * n))
+    parent = array.array("i", [-1]) * n
+    parent_slot = array.array("i", [-1]) * n
+    for v in range(n):
+        for e in range(offsets[v], offsets[v + 1]):
+            t = targets[e]
+            in_degree[t] += 1
+            parent[t] = v
+            parent_slot[t] = slot_codes[e]
+
+    # Parents first, so a vertex joins the super-vertex its parent already has.
+    representative = array.array("i", range(n))
+    for v in reversed(base.topological_order(graph)):
+        if in_degree[v] != 1:
+            continue
+        p, kind = parent[v], kinds[v]
+        if ((kind == _APPLICATION and kinds[p] == _APPLICATION and parent_slot[v] == slot_n0)
+                or (kind in _BINDERS and kinds[p] == kind and parent_slot[v] == slot_n2)):
+            representative[v] = representative[p]
+
+    # Names are folded into the labels, so name vertices and every edge into
+    # one are left out.
+    weights = {}
+    for v in range(n):
+        if kinds[v] in _NAME_KINDS:
+            continue
+        source = representative[v]
+        for e in range(offsets[v], offsets[v + 1]):
+            t = targets[e]
+            if kinds[t] in _NAME_KINDS:
+                continue
+            target = representative[t]
+            if target == source:
+                continue
+            key = (source, target, slot_codes[e])
+            weights[key] = weights.get(key, 0) + 1
+    return [key + (weight,) for key, weight in weights.items()]
+
+
+def declaration_edges(graph):
+    """
+    Returns the weighted edges (source, target, None, weight) between the
+    top-level declarations of a base.Graph, as vertex indices.
+    """
+    n = graph.num_vertices
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    groups, ids, kinds = graph.groups, graph.ids, graph.kinds
+    slot_n0 = graph.slots.index("n0") if "n0" in graph.slots else -1
+
+    # Expressions refer to declarations by name (#EC -> #NS), so map every name
+    # to the declaration it names; constructor names map to their #IND.
+    constructor_slots = {code for code, slot in enumerate(graph.slots)
+                         if slot.startswith("pair") and slot.endswith("_A")}
+    declaration_of = array.array("i", [-1]) * n
+    for v in range(n):
+        if groups[v] not in _DECLARATION_GROUPS:
+            continue
+        for e in range(offsets[v], offsets[v + 1]):
+            if slot_codes[e] in constructor_slots:
+                declaration_of[targets[e]] = v
+        name = graph.index_of("A", ids[v])
+        if name is not None:
+            declaration_of[name] = v
+
+    # Each declaration walks the expressions of its own type and value and
+    # counts the constants among them. A stamp per vertex marks the vertices
+    # already visited for the current declaration.
+    stamp = array.array("i", [-1]) * n
+    edges = []
+    for d in range(n):
+        if groups[d] not in _DECLARATION_GROUPS:
+            continue
+        weights = {}
+        stamp[d] = d
+        pending = [d]
+        while pending:
+            v = pending.pop()
+            constant = kinds[v] == _CONSTANT
+            for e in range(offsets[v], offsets[v + 1]):
+                t = targets[e]
+                if constant and slot_codes[e] == slot_n0:
+                    target = declaration_of[t]
+                    if target >= 0 and target != d:
+                        weights[target] = weights.get(target, 0) + 1
+                elif stamp[t] != d and groups[t] in _EXPRESSION_GROUPS:
+                    stamp[t] = d
+                    pending.append(t)
+        edges.extend((d, t, None, weight) for t, weight in sorted(weights.items()))
+    return edges
+
+
+def write_coarse_csv(graph, edges, path, labels=None):
+    """
+    Writes weighted edges from coarsen_terms or declaration_edges to a CSV file
+    with columns source, target, dependency_kind and weight ("-" for standard output).
+    Vertices are named by labels (default: graph.labels).
+    """
+    labels = graph.labels if labels is None else labels
+    slots = graph.slots
+    with compressed.output_file(path) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['source', 'target', 'dependency_kind', 'weight'])
+        for source, target, slot, weight in edges:
+            writer.writerow([labels[source], labels[target],
+                             DECLARATION_KIND if slot is None else slots[slot], weight])
@@ -0,0 +1,125 @@
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import queue
+import sys
+import threading
+
+"""
+This is the compressed I/O module.
+input_file and output_file open the exports and outputs of the other modules by path,
+with "-" for standard input or output and a .gz, .bz2 or .xz suffix for a compressed
+stream (stdlib gzip, bz2 and lzma only):
+   - compressed input is decompressed as it is read, never to disk,
+   - compressed output is compressed on a background thread: the writer hands over
+     1 MB blocks through a bounded queue, and since zlib, bz2 and lzma release the GIL
+     while they compress, compression overlaps with parsing.
+"""
+
+COMPRESSED_SUFFIXES = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+BLOCK_SIZE = 1 << 20
+QUEUE_SIZE = 16
+
+
+def _opener(path):
+    for suffix, opener in COMPRESSED_SUFFIXES.items():
+        if path.endswith(suffix):
+            return opener
+    return None
+
+
+def is_compressed(path):
+    """Whether path names a compressed file."""
+    return _opener(path) is not None
+
+
+def strip_compression(path):
+    """path without its compression suffix (Export.txt.gz -> Export.txt)."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def is_seekable(path):
+    """Whether path is a plain file that can be memory-mapped or seeked into."""
+    return path != '-' and not is_compressed(path)
+
+
+class _CompressorThread(io.RawIOBase):
+    """A raw binary writer whose blocks are compressed and written by a background thread."""
+
+    def __init__(self, path, opener):
+        super().__init__()
+        self._file = opener(path, "wb")
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self._error is None:
+                try:
+                    self._file.write(block)
+                except Exception as error:
+                    self._error = error
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._file.close()
+        finally:
+            super().close()
+        if self._error is not None:
+            raise self._error
+
+
+@contextlib.contextmanager
+def input_file(path):
+    """
+    Opens an export for reading as text: "-" is standard input, and a .gz,
+    .bz2 or .xz file is decompressed as a stream.
+    """
+    if path == '-':
+        yield sys.stdin
+        return
+    opener = _opener(path)
+    with (open(path, 'r') if opener is None else opener(path, 'rt')) as file:
+        yield file
+
+
+@contextlib.contextmanager
+def output_file(path, newline=''):
+    """
+    Opens an output for writing as text: "-" is standard output (left open),
+    and a .gz, .bz2 or .xz path is compressed on a background thread.
+    """
+    if path == '-':
+        yield sys.stdout
+        return
+    opener = _opener(path)
+    if opener is None:
+        file = open(path, 'w', newline=newline)
+    else:
+        raw = _CompressorThread(path, opener)
+        file = io.TextIOWrapper(io.BufferedWriter(raw, BLOCK_SIZE), newline=newline)
+    with file:
+        yield file
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import threading
+import base
+import names
+
+"""
+This is the training-example module.
+write_examples turns a base.Graph into one example per top-level declaration (#DEF, #AX,
+#IND): the declaration's name and the edges of its dependency subgraph, i.e. everything
+reachable from the declaration. Expressions refer to other declarations through their
+names (#EC -> #NS), so the subgraph records what the declaration depends on without
+containing the bodies of those declarations, which are in their own examples. The
+traversal still stops at declaration vertices, should an export ever link one directly.
+
+Examples are written as JSON lines into shard files (examples-00000.jsonl, ...) of
+bounded size that a data loader can stream. Serialization happens on the calling thread;
+the files are written by a background thread draining a bounded queue, so building
+examples only waits on the disk when the queue is full. index.json maps every declaration
+name to its (shard, byte offset, length), and ExampleShards uses it to read any example
+with a single seek.
+"""
+
+SHARD_BYTES = 64 << 20
+QUEUE_SIZE = 256
+INDEX_FILE = "index.json"
+
+_DECLARATION_GROUPS = (base.GROUP_CODES["D"], base.GROUP_CODES["E"])
+
+
+def declaration_subgraph(graph, root):
+    """
+    Returns the edges (source, target, slot code) reachable from vertex root
+    without passing through another declaration, sorted by source vertex.
+    """
+    offsets, targets, slot_codes, groups = graph.offsets, graph.targets, graph.slot_codes, graph.groups
+    seen = {root}
+    pending = [root]
+    sources = []
+    while pending:
+        v = pending.pop()
+        sources.append(v)
+        for e in range(offsets[v], offsets[v + 1]):
+            t = targets[e]
+            if t not in seen and groups[t] not in _DECLARATION_GROUPS:
+                seen.add(t)
+                pending.append(t)
+    sources.sort()
+    return [(v, targets[e], slot_codes[e]) for v in sources for e in range(offsets[v], offsets[v + 1])]
+
+
+class _ShardWriter(threading.Thread):
+    """Writes encoded examples from a bounded queue into size-bounded shard files."""
+
+    def __init__(self, directory, shard_bytes, queue_size):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.shards = []
+        self.index = {}
+        self.error = None
+
+    def run(self):
+        file = None
+        position = 0
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                name, line = item
+                if file is None or (position and position + len(line) > self.shard_bytes):
+                    if file is not None:
+                        file.close()
+                    shard = f"examples-{len(self.shards):05d}.jsonl"
+                    self.shards.append(shard)
+                    file = open(os.path.join(self.directory, shard), "wb")
+                    position = 0
+                file.write(line)
+                self.index[name] = (len(self.shards) - 1, position, len(line))
+                position += len(line)
+        except BaseException as error:
+            self.error = error
+            # Keep draining so the producer never blocks on a dead writer.
+            while self.queue.get() is not None:
+                pass
+        finally:
+            if file is not None:
+                file.close()
+
+
+def write_examples(graph, directory, resolver=None, shard_bytes=SHARD_BYTES, queue_size=QUEUE_SIZE):
+    """
+    Writes one example per top-level declaration of a base.Graph into JSONL
+    shards of at most shard_bytes bytes (an example larger than that gets a
+    shard of its own) and the index.json of directory. Returns the number of
+    examples.
+
+    Each line is {"name", "vertex", "kind", "edges": [[source, target, slot], ...]}
+    with vertices given by label. Declarations are named by their dotted full
+    name (resolved through resolver, a names.NameResolver, which must be built
+    before any relabelling) or by their label if their name is not in the export.
+    """
+    os.makedirs(directory, exist_ok=True)
+    resolver = resolver or names.NameResolver(graph)
+    labels, slots = graph.labels, graph.slots
+    writer = _ShardWriter(directory, shard_bytes, queue_size)
+    writer.start()
+    count = 0
+    try:
+        for v in range(graph.num_vertices):
+            if graph.groups[v] not in _DECLARATION_GROUPS:
+                continue
+            if writer.error is not None:
+                break
+            name = resolver.name_of_id(graph.ids[v]) or labels[v]
+            edges = [[labels[source], labels[target], slots[slot]]
+                     for source, target, slot in declaration_subgraph(graph, v)]
+            example = {"name": name, "vertex": labels[v], "kind": base.KIND_MARKERS[graph.kinds[v]],
+                       "edges": edges}
+            line = (json.dumps(example, ensure_ascii=False) + "\n").encode("utf-8")
+            writer.queue.put((name, line))
+            count += 1
+    finally:
+        writer.queue.put(None)
+        writer.join()
+    if writer.error is not None:
+        raise writer.error
+    with open(os.path.join(directory, INDEX_FILE), "w") as file:
+        json.dump({"shards": writer.shards, "examples": writer.index}, file)
+    return count
+
+
+class ExampleShards:
+    """
+    Random access to the examples written by write_examples.
+
+    Usage:
+        with ExampleShards("examples") as shards:
+            example = shards["Nat.gcd_self"]
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as file:
+            index = json.load(file)
+        self.shards = index["shards"]
+        self.index = index["examples"]
+        self._files = {}
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, name):
+        shard, offset, length = self.index[name]
+        file = self._files.get(shard)
+        if file is None:
+            file = self._files[shard] = open(os.path.join(self.directory, self.shards[shard]), "rb")
+        file.seek(offset)
+        return json.loads(file.read(length))
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
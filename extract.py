@@ -0,0 +1,189 @@
+import array
+import os
+import zipfile
+import base
+
+"""
+This is the extraction module.
+One scan over an export builds a persistent index from every vertex key (group, unique_id)
+to the byte offset of the line defining it, along with the (parent, component) pairs of
+the #NS lines so that declarations can be found by their dotted name. The index is stored
+next to the export (Export.txt.idx) as an .npz archive of plain integer and byte arrays
+(the format of base.Graph.save), so loading an index that came with a shared export runs
+no code, and it is rebuilt only when the export changes.
+
+With the index, extract_subgraph starts from a few roots and seeks to, reads and parses
+only the lines reachable from them through base.parse_declaration, so extracting one
+theorem's cone from a multi-GB export touches a few MB of it.
+"""
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+
+
+class LineIndex:
+    """
+    Byte offsets of the lines of an export, keyed by (group, unique_id).
+
+    Attributes:
+        offsets (dict): (group, unique_id) -> offset of its (last) defining line.
+        names (dict): (parent name id, component) -> name id, from the #NS lines.
+    """
+
+    def __init__(self, offsets, names):
+        self.offsets = offsets
+        self.names = names
+
+    @classmethod
+    def scan(cls, file_path):
+        """Builds the index with one pass over the export."""
+        offsets = {}
+        names = {}
+        position = 0
+        with open(file_path, "rb") as file:
+            for raw in file:
+                parts = raw.decode("utf-8").split()
+                offset = position
+                position += len(raw)
+                if not parts:
+                    continue
+                kind = next((part for part in parts if part.startswith("#")), None)
+                code = base.KIND_CODES.get(kind)
+                if code is None:
+                    continue
+                group = base.KIND_GROUPS[code]
+                # The unique id is the first token, except for #DEF/#AX (second)
+                # and #IND (third); see base.decode_command.
+                if group == "D":
+                    unique_id = int(parts[1])
+                elif group == "E":
+                    unique_id = int(parts[2])
+                else:
+                    unique_id = int(parts[0])
+                offsets[(group, unique_id)] = offset
+                if kind == "#NS" and len(parts) >= 4:
+                    names[(int(parts[2]), parts[3])] = unique_id
+        return cls(offsets, names)
+
+    @classmethod
+    def load_or_build(cls, file_path, rebuild=False):
+        """
+        Returns the index of an export, loading it from file_path + ".idx" when
+        that was built from the current file, and building and saving it otherwise.
+        """
+        stat = os.stat(file_path)
+        stamp = (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+        index_path = file_path + INDEX_SUFFIX
+        if not rebuild:
+            try:
+                index = cls.load(index_path, stamp)
+                if index is not None:
+                    return index
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+                pass
+        index = cls.scan(file_path)
+        try:
+            index.save(index_path, stamp)
+        except OSError:
+            pass  # A read-only location only costs a rescan next time.
+        return index
+
+    def save(self, path, stamp):
+        """Saves the index and the stamp of its export as an .npz archive of arrays."""
+        keys = list(self.offsets.items())
+        names = list(self.names.items())
+        component_blob, component_offsets = base._pack_strings(component for (_, component), _ in names)
+        members = [
+            ("stamp", array.array("q", stamp), "<i8"),
+            ("key_groups", array.array("B", (base.GROUP_CODES[group] for (group, _), _ in keys)), "|u1"),
+            ("key_ids", array.array("q", (unique_id for (_, unique_id), _ in keys)), "<i8"),
+            ("key_offsets", array.array("q", (offset for _, offset in keys)), "<i8"),
+            ("name_parents", array.array("q", (parent for (parent, _), _ in names)), "<i8"),
+            ("name_ids", array.array("q", (name_id for _, name_id in names)), "<i8"),
+            ("component_blob", component_blob, "|u1"),
+            ("component_offsets", component_offsets, "<i8"),
+        ]
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, values, descr in members:
+                archive.writestr(f"{name}.npy", base._npy_bytes(values, descr))
+
+    @classmethod
+    def load(cls, path, stamp):
+        """
+        Loads an index saved by save, or returns None if it was saved with
+        another stamp. Raises OSError, KeyError, ValueError or
+        zipfile.BadZipFile if path is not such an index.
+        """
+        with zipfile.ZipFile(path) as archive:
+            if tuple(base._npy_array(archive.read("stamp.npy"))) != tuple(stamp):
+                return None
+            arrays = {name[:-4]: base._npy_array(archive.read(name)) for name in archive.namelist()}
+        key_groups, key_ids, key_offsets = arrays["key_groups"], arrays["key_ids"], arrays["key_offsets"]
+        offsets = {(base.GROUPS[key_groups[i]], key_ids[i]): key_offsets[i] for i in range(len(key_ids))}
+        components = base._unpack_strings(arrays["component_blob"], arrays["component_offsets"])
+        names = {(parent, component): name_id
+                 for parent, component, name_id in zip(arrays["name_parents"], components, arrays["name_ids"])}
+        return cls(offsets, names)
+
+    def resolve_name(self, dotted_name):
+        """Returns the name id of a dotted name such as Nat.gcd_self, or None."""
+        name_id = 0
+        for component in dotted_name.split("."):
+            name_id = self.names.get((name_id, component))
+            if name_id is None:
+                return None
+        return name_id
+
+    def resolve_root(self, root):
+        """
+        Returns the key of a root given either as a key prefix or label (D_1234)
+        or as the dotted name of a #DEF/#AX/#IND declaration, or None.
+        """
+        group, _, rest = root.partition("_")
+        if group in base.GROUP_CODES:
+            try:
+                key = (group, int(rest.split("_", 1)[0]))
+            except ValueError:
+                key = None
+            if key in self.offsets:
+                return key
+        name_id = self.resolve_name(root)
+        if name_id is not None:
+            for group in ("D", "E"):
+                if (group, name_id) in self.offsets:
+                    return (group, name_id)
+        return None
+
+
+def extract_subgraph(file_path, index, roots):
+    """
+    Returns the edges (source, target, dependency_kind) of the subgraph reachable
+    from the given root keys, in file order, reading only the lines of that subgraph.
+    """
+    offsets = index.offsets
+    vertices_dict = {}
+    lines = []
+    pending = [root for root in roots if root in offsets]
+    queued = set(pending)
+    with open(file_path, "rb") as file:
+        while pending:
+            key = pending.pop()
+            offset = offsets[key]
+            file.seek(offset)
+            record = base.decode_command(file.readline().decode("utf-8"))
+            vertex = base.record_identity(record)
+            vertices_dict[key] = vertex
+            references = [(group, linked_id, slot)
+                          for group, linked_id, slot in base.record_references(record)
+                          if (group, linked_id) in offsets]
+            lines.append((offset, vertex, references))
+            for group, linked_id, _ in references:
+                target = (group, linked_id)
+                if target not in queued:
+                    queued.add(target)
+                    pending.append(target)
+    lines.sort(key=lambda line: line[0])
+    return [(vertex, vertices_dict[(group, linked_id)], slot)
+            for _, vertex, references in lines
+            for group, linked_id, slot in references]
+
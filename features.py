@@ -0,0 +1,127 @@
+import array
+import csv
+import heapq
+import base
+import compressed
+
+"""
+This is the feature module.
+compute_features turns a base.Graph (the edges of base.compute_edge_list) into a per-vertex
+feature table for machine learning datasets:
+   - in_degree, out_degree: number of incoming and outgoing edges,
+   - depth: length of the longest path from the vertex down to a leaf,
+   - height: length of the longest path from a root (a vertex nothing depends on) down to it,
+   - cone_size: approximate number of vertices in its dependency cone, itself included,
+   - slot_<kind>: number of outgoing edges of each dependency kind.
+
+Every feature is a dynamic program over base.topological_order and integer arrays, so the
+whole pass is linear in the number of edges. The exact cone size is quadratic in the worst
+case (see reach.py), so cone_size is estimated with a k-minimum-values sketch: every vertex
+hashes to a random 64-bit value, a vertex keeps the k smallest hashes of its cone (merged
+from its children's sketches), and a full sketch whose largest value is h estimates the cone
+size as (k - 1) * 2^64 / h, with a relative error around 1 / sqrt(k). Cones smaller than k
+are counted exactly. A child's sketch is dropped once its last parent has merged it.
+"""
+
+SKETCH_SIZE = 64
+_MASK = (1 << 64) - 1
+
+
+def _vertex_hash(v):
+    # splitmix64; never 0, so 0 can mark an empty slot.
+    z = (v * 0x9E3779B97F4A7C15 + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return (z ^ (z >> 31)) or 1
+
+
+class GraphFeatures:
+    """
+    Per-vertex features of a base.Graph, as integer arrays indexed by vertex.
+
+    Attributes:
+        in_degree, out_degree, depth, height, cone_size: one array each.
+        slot_counts: one array per dependency kind, in the order of graph.slots.
+    """
+
+    def __init__(self, graph, in_degree, out_degree, depth, height, cone_size, slot_counts):
+        self.graph = graph
+        self.in_degree = in_degree
+        self.out_degree = out_degree
+        self.depth = depth
+        self.height = height
+        self.cone_size = cone_size
+        self.slot_counts = slot_counts
+
+    def write_csv(self, path):
+        """
+        Writes the feature table, one row per vertex, to a CSV file.
+
+        The path "-" writes to standard output, and a .gz, .bz2 or .xz path is
+        compressed on a background thread.
+        """
+        graph = self.graph
+        with compressed.output_file(path) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['vertex', 'kind', 'in_degree', 'out_degree', 'depth', 'height', 'cone_size']
+                            + [f'slot_{slot}' for slot in graph.slots])
+            for v in range(graph.num_vertices):
+                writer.writerow([graph.labels[v], base.KIND_MARKERS[graph.kinds[v]],
+                                 self.in_degree[v], self.out_degree[v], self.depth[v], self.height[v],
+                                 self.cone_size[v]]
+                                + [counts[v] for counts in self.slot_counts])
+
+
+def compute_features(graph, sketch_size=SKETCH_SIZE):
+    """
+    Computes the GraphFeatures of a base.Graph in O(E * sketch_size) time.
+    Raises ValueError if the graph has a cycle.
+    """
+    n = graph.num_vertices
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    order = base.topological_order(graph)
+
+    in_degree = array.array("q", bytes(8 * n))
+    out_degree = array.array("q", bytes(8 * n))
+    slot_counts = [array.array("q", bytes(8 * n)) for _ in graph.slots]
+    for v in range(n):
+        out_degree[v] = offsets[v + 1] - offsets[v]
+        for e in range(offsets[v], offsets[v + 1]):
+            in_degree[targets[e]] += 1
+            slot_counts[slot_codes[e]][v] += 1
+
+    # Children first: depth and the cone sketches.
+    depth = array.array("q", bytes(8 * n))
+    cone_size = array.array("q", bytes(8 * n))
+    sketches = [None] * n
+    pending = array.array("q", in_degree)
+    for v in order:
+        values = {_vertex_hash(v)}
+        longest = -1
+        for e in range(offsets[v], offsets[v + 1]):
+            t = targets[e]
+            if depth[t] > longest:
+                longest = depth[t]
+            values.update(sketches[t])
+            pending[t] -= 1
+            if not pending[t]:
+                sketches[t] = None
+        depth[v] = longest + 1
+        sketch = heapq.nsmallest(sketch_size, values) if len(values) > sketch_size else sorted(values)
+        if len(sketch) < sketch_size:
+            cone_size[v] = len(sketch)
+        else:
+            cone_size[v] = round((sketch_size - 1) * (1 << 64) / sketch[-1])
+        if pending[v]:
+            sketches[v] = sketch
+
+    # Parents first: height.
+    height = array.array("q", bytes(8 * n))
+    for v in reversed(order):
+        below = height[v] + 1
+        for e in range(offsets[v], offsets[v + 1]):
+            t = targets[e]
+            if height[t] < below:
+                height[t] = below
+
+    return GraphFeatures(graph, in_degree, out_degree, depth, height, cone_size, slot_counts)
@@ -1,6 +1,17 @@
+import argparse
 import csv
+import os
 import sys
 import base
+import cache
+import coarsen
+import compressed
+import examples
+import extract
+import features
+import names
+import parallel
+import stats
 
 """
 This is the I/O module.
@@ -11,76 +22,283 @@ or whose labels contain no letters,
 and writes the resulting graph to a CSV file.
 """
 
+def read_declaration_commands(file_path):
+    """
+    Reads the declaration commands of a .txt file into a list, like
+    parse_declaration_commands, but raises instead of exiting: OSError if the
+    file cannot be read, UnicodeDecodeError if it is not UTF-8 text.
+    """
+    with compressed.input_file(file_path) as file:
+        return [command for command in (line.strip() for line in file) if command]
+
 def parse_declaration_commands(file_path):
     """
     Parses a .txt file where each line contains a declaration command.
     
     Parameters:
-        file_path (str): The path to the .txt file containing declaration commands.
+        file_path (str): The path to the .txt file containing declaration commands
+            ("-" for standard input; .gz, .bz2 and .xz files are decompressed as read).
     
     Returns:
         list: A list of declaration command strings.
     """
-    declaration_commands = []
     try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                command = line.strip()
-                if command:
-                    declaration_commands.append(command)
+        return read_declaration_commands(file_path)
     except FileNotFoundError:
         print(f"Error: File not found at path {file_path}")
         sys.exit(1)
     except Exception as e:
         print(f"An error occurred: {e}")
         sys.exit(1)
-    return declaration_commands
+
+def write_graph_csv(graph, path, hashes=None):
+    """
+    Writes the edges of a base.Graph to a CSV file ("-" for standard output;
+    a .gz, .bz2 or .xz path is compressed on a background thread).
+
+    The CSV has three columns: source, target, and dependency_kind.
+    The source and target are output using only the vertex label.
+    If hashes (from base.structural_hashes) are given, two more columns,
+    source_hash and target_hash, hold the hex structural hashes of the endpoints.
+    """
+    labels, slots = graph.labels, graph.slots
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    with compressed.output_file(path) as csvfile:
+        writer = csv.writer(csvfile)
+        if hashes is None:
+            writer.writerow(['source', 'target', 'dependency_kind'])
+            for v in range(graph.num_vertices):
+                source_label = labels[v]
+                for e in range(offsets[v], offsets[v + 1]):
+                    writer.writerow([source_label, labels[targets[e]], slots[slot_codes[e]]])
+        else:
+            hex_hashes = [digest.hex() for digest in hashes]
+            writer.writerow(['source', 'target', 'dependency_kind', 'source_hash', 'target_hash'])
+            for v in range(graph.num_vertices):
+                source_label = labels[v]
+                for e in range(offsets[v], offsets[v + 1]):
+                    t = targets[e]
+                    writer.writerow([source_label, labels[t], slots[slot_codes[e]],
+                                     hex_hashes[v], hex_hashes[t]])
+
+def write_graph_tables(graph, directory, hashes=None, suffix=''):
+    """
+    Writes a base.Graph as normalized tables in directory:
+       - vertices.csv: id (dense integer), group, unique_id, kind, label
+         (plus hash, the hex structural hash, if hashes are given),
+       - edges.csv: source, target (vertex ids) and slot_code,
+       - slots.csv: slot_code and dependency_kind.
+    
+    Each label is written once, in the vertices table; edges are integer-only.
+    A suffix of .gz, .bz2 or .xz compresses every table (vertices.csv.gz, ...).
+    """
+    os.makedirs(directory, exist_ok=True)
+    groups, ids, kinds, labels = graph.groups, graph.ids, graph.kinds, graph.labels
+    with compressed.output_file(os.path.join(directory, 'vertices.csv' + suffix)) as csvfile:
+        writer = csv.writer(csvfile)
+        header = ['id', 'group', 'unique_id', 'kind', 'label']
+        writer.writerow(header if hashes is None else header + ['hash'])
+        for v in range(graph.num_vertices):
+            row = [v, base.GROUPS[groups[v]], ids[v], base.KIND_MARKERS[kinds[v]], labels[v]]
+            if hashes is not None:
+                row.append(hashes[v].hex())
+            writer.writerow(row)
+    offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+    with compressed.output_file(os.path.join(directory, 'edges.csv' + suffix)) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['source', 'target', 'slot_code'])
+        for v in range(graph.num_vertices):
+            for e in range(offsets[v], offsets[v + 1]):
+                writer.writerow([v, targets[e], slot_codes[e]])
+    with compressed.output_file(os.path.join(directory, 'slots.csv' + suffix)) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['slot_code', 'dependency_kind'])
+        writer.writerows(enumerate(graph.slots))
+
+def iter_declaration_commands(file_path):
+    """
+    Yields the declaration commands of a .txt file one at a time, without
+    loading the file into memory.
+    
+    Parameters:
+        file_path (str): The path to the .txt file containing declaration commands
+            ("-" for standard input; .gz, .bz2 and .xz files are decompressed as read).
+    """
+    if file_path != '-' and not os.path.isfile(file_path):
+        print(f"Error: File not found at path {file_path}")
+        sys.exit(1)
+    with compressed.input_file(file_path) as file:
+        for line in file:
+            command = line.strip()
+            if command:
+                yield command
+
+def write_edge_list_csv(edge_list, path):
+    """
+    Writes (source, target, dependency_kind) edges to a CSV file as they arrive.
+    
+    The path "-" writes to standard output, and a .gz, .bz2 or .xz path is
+    compressed on a background thread.
+    """
+    with compressed.output_file(path) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['source', 'target', 'dependency_kind'])
+        for source, target, dep_kind in edge_list:
+            writer.writerow([source[2], target[2], dep_kind])
 
 def main():
     """
-    Main function: reads the input file, precomputes a dictionary of vertices (with additional
-    naming information), computes the edge list among declaration commands (including dependency kinds),
-    optionally filters out vertices that either lack additional information or whose labels
-    contain no letters (and edges involving them),
+    Main function: reads the input file, decodes every declaration command once,
+    builds the array-backed graph (vertices with additional naming information and
+    the edges among them, including dependency kinds),
     and writes the output graph to a CSV file.
     
     In the CSV file the source and target of each edge are named solely by the vertex label.
     """
-    if len(sys.argv) != 2:
-        print("Usage: python3 main.py <InputFilePath>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Converts a Lean export into graph.csv.")
+    parser.add_argument("input", help="path to the Export.txt file ('-' for stdin; .gz, .bz2 and .xz are decompressed)")
+    parser.add_argument("-o", "--output",
+                        help="path of the output CSV (default: graph.csv, not written with --tables; '-' for stdout; "
+                             "a .gz, .bz2 or .xz suffix compresses it)")
+    parser.add_argument("--npz", metavar="PATH",
+                        help="also save the array-backed graph (base.Graph) to PATH")
+    parser.add_argument("--binary", metavar="PATH",
+                        help="also write the memory-mappable binary graph (base.BinaryGraph) to PATH")
+    parser.add_argument("--tables", metavar="DIR",
+                        help="write normalized vertices.csv, edges.csv and slots.csv tables to DIR instead of graph.csv")
+    parser.add_argument("--compress", choices=["gz", "bz2", "xz"],
+                        help="compress the --tables files (vertices.csv.gz, ...); -o and other paths are "
+                             "compressed by their own suffix")
+    parser.add_argument("--names", action="store_true",
+                        help="label names, declarations, constants and binders with dotted full names (Nat.gcd_self)")
+    parser.add_argument("--coarsen", choices=["terms", "declarations"],
+                        help="write a coarsened graph with full names and a weight column instead: "
+                             "'declarations' keeps only #DEF/#AX/#IND and is small enough to visualize; 'terms' "
+                             "merges application spines and binder chains and drops names, which removes well "
+                             "under half of the edges")
+    parser.add_argument("--features", metavar="PATH",
+                        help="also write per-vertex degrees, depth, height, approximate cone size and "
+                             "per-slot edge counts to PATH (CSV)")
+    parser.add_argument("--examples", metavar="DIR",
+                        help="also write one JSONL training example per #DEF/#AX/#IND, in shards with an index, to DIR")
+    parser.add_argument("--shard-size", type=int, default=64, metavar="MB",
+                        help="size cap of each --examples shard (default: 64)")
+    parser.add_argument("--hashes", action="store_true",
+                        help="add the structural hashes of source and target as two more columns")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each edge as its line is read, in memory proportional to the vertices")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse per-chunk parsing results cached in DIR across runs")
+    parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                        help="size cap of the --cache directory (default: 1024)")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="write per-kind line, edge, time, unresolved-reference and duplicate-key counts to PATH (JSON)")
+    parser.add_argument("--extract", action="append", metavar="ROOT",
+                        help="write only the subgraph reachable from ROOT (a dotted declaration name such as "
+                             "Nat.gcd_self, or a vertex key such as D_37), reading only its lines; repeatable")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help="parse the export in N processes over byte-range shards")
+    args = parser.parse_args()
+    if args.output is None and not args.tables:
+        args.output = 'graph.csv'
+    if args.compress and not args.tables:
+        parser.error("--compress applies to --tables")
+    whole_graph = args.npz or args.binary or args.hashes or args.tables or args.names or args.features or args.examples or args.coarsen
+    if args.coarsen and args.output is None:
+        parser.error("--coarsen writes the coarsened graph to -o, which --tables leaves unset")
+    if args.stream and whole_graph:
+        parser.error("--npz, --binary, --hashes, --tables, --names, --features, --examples and --coarsen "
+                     "need the whole graph and cannot be combined with --stream")
+    if args.jobs is not None and (args.stream or whole_graph):
+        parser.error("--jobs cannot be combined with --stream, --npz, --binary, --hashes, --tables, "
+                     "--names, --features, --examples or --coarsen")
+    if args.cache and (args.stream or args.jobs is not None):
+        parser.error("--cache cannot be combined with --stream or --jobs")
+    if args.stats and (args.stream or args.jobs is not None or args.cache):
+        parser.error("--stats cannot be combined with --stream, --jobs or --cache")
+    if (args.extract or args.jobs is not None) and not compressed.is_seekable(args.input):
+        parser.error("--extract and --jobs need an uncompressed export file")
     
-    file_path = sys.argv[1]
-    declaration_commands = parse_declaration_commands(file_path)
+    if args.extract:
+        if args.stream or args.jobs is not None or args.cache or args.stats or whole_graph:
+            parser.error("--extract cannot be combined with other modes")
+        index = extract.LineIndex.load_or_build(args.input)
+        roots = []
+        for root in args.extract:
+            key = index.resolve_root(root)
+            if key is None:
+                print(f"Error: No declaration or vertex {root} in {args.input}")
+                sys.exit(1)
+            roots.append(key)
+        write_edge_list_csv(extract.extract_subgraph(args.input, index, roots), args.output)
+        return
     
-    # Precompute vertices in a dictionary for efficient lookup.
-    # Each vertex is computed from a declaration command via base.compute_identity.
-    # The key is (group, unique_id) and the value is the vertex tuple (group, unique_id, label).
-    vertices_dict = {}
-    for command in declaration_commands:
-        vertex = base.compute_identity(command)
-        key = (vertex[0], vertex[1])
-        vertices_dict[key] = vertex
+    if args.jobs is not None:
+        parallel.parallel_edge_csv(args.input, args.output, args.jobs)
+        return
     
-    # Compute the edge list.
-    edge_list = []
-    for command in declaration_commands:
-        edges = base.compute_edge_list(command, vertices_dict)
-        for edge in edges:
-            edge_list.append(edge)
+    if args.stream:
+        commands = iter_declaration_commands(args.input)
+        write_edge_list_csv(base.stream_edge_list(commands), args.output)
+        return
     
+    declaration_commands = parse_declaration_commands(args.input)
     
-    # Write the edge list to a CSV file.
-    # The CSV will have three columns: source, target, and dependency_kind.
-    # The source and target are output using only the vertex label.
-    with open('graph.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['source', 'target', 'dependency_kind'])
-        for edge in edge_list:
-            source_label = edge[0][2]
-            target_label = edge[1][2]
-            dep_kind = edge[2]
-            writer.writerow([source_label, target_label, dep_kind])
+    # Decode every command once, then build the graph from the decoded records.
+    # Vertices are keyed by (group, unique_id); edges are stored in CSR form.
+    # Hashes also take the few references the graph has no edge for from the
+    # records, which are collected right away so the records can be dropped.
+    parse_stats = None
+    rewired = None
+    if args.stats:
+        parse_stats = stats.ParseStats()
+        graph = stats.instrumented_build_graph(declaration_commands, parse_stats)
+        if args.hashes:
+            rewired = base.group_g_references(graph, map(base.decode_command, declaration_commands))
+        del declaration_commands
+    elif args.cache:
+        export_cache = cache.ExportCache(args.cache, max_bytes=args.cache_size << 20)
+        graph = export_cache.build_graph(declaration_commands)
+        if args.hashes:
+            rewired = base.group_g_references(graph, map(base.decode_command, declaration_commands))
+        del declaration_commands
+    else:
+        # The command strings are dropped before the graph is built, so they
+        # and the graph are never alive at the same time.
+        records = [base.decode_command(command) for command in declaration_commands]
+        del declaration_commands
+        graph = base.build_graph(records)
+        if args.hashes:
+            rewired = base.group_g_references(graph, records)
+        del records
+    
+    # Hashes read the literal payload from the labels, so they come first.
+    # So do name components; the resolver keeps them once resolved.
+    hashes = base.structural_hashes(graph, rewired) if args.hashes else None
+    resolver = names.NameResolver(graph)
+    full_labels = names.full_name_labels(graph, resolver) if args.names or args.coarsen else None
+    if args.names:
+        graph.labels = full_labels
+    if args.output is not None and args.coarsen:
+        if args.coarsen == "terms":
+            coarse_edges = coarsen.coarsen_terms(graph)
+        else:
+            coarse_edges = coarsen.declaration_edges(graph)
+        coarsen.write_coarse_csv(graph, coarse_edges, args.output, full_labels)
+    elif args.output is not None:
+        write_graph_csv(graph, args.output, hashes)
+    if args.npz:
+        graph.save(args.npz)
+    if args.binary:
+        base.write_binary_graph(graph, args.binary)
+    if args.tables:
+        write_graph_tables(graph, args.tables, hashes, f'.{args.compress}' if args.compress else '')
+    if args.features:
+        features.compute_features(graph).write_csv(args.features)
+    if args.examples:
+        examples.write_examples(graph, args.examples, resolver, shard_bytes=args.shard_size << 20)
+    if parse_stats is not None:
+        parse_stats.write_json(args.stats)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+import base
+
+"""
+This is the name resolution module.
+The #NS/#NI lines form a parent-pointer tree of hierarchical names (n' #NS n0 s), but
+vertex labels only show the last component (A_6_refl). NameResolver rebuilds the dotted
+full name of every name vertex (Eq.refl, Nat.gcd_self) and full_name_labels propagates
+them into the labels of the declarations and expressions that refer to names.
+RecordNameResolver does the same from decoded records, keyed by name id, for terms.py.
+
+Each name is resolved once and memoized: resolving a name walks up only to the nearest
+ancestor already resolved, then fills in the names along the way, so resolving all N
+names costs O(N) steps in total rather than O(N * depth).
+"""
+
+_NAME_KINDS = (base.KIND_CODES["#NS"], base.KIND_CODES["#NI"])
+
+
+class NameResolver:
+    """Dotted full names of the name vertices (#NS/#NI) of a base.Graph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._names = {}
+
+    def _is_name(self, v):
+        return self.graph.kinds[v] in _NAME_KINDS
+
+    def _parent(self, v):
+        # The parent of a name is its slot "n0" target; the anonymous root is
+        # never written out, so its children have no such edge.
+        graph = self.graph
+        if graph.offsets[v] == graph.offsets[v + 1]:
+            return None
+        parent = graph.targets[graph.offsets[v]]
+        return parent if self._is_name(parent) else None
+
+    def _component(self, v):
+        graph = self.graph
+        # A name's label is A_<id>_<component>.
+        return graph.labels[v][len(str(graph.ids[v])) + 3:]
+
+    def full_name(self, v):
+        """
+        Returns the dotted full name of name vertex v, or None if v is not a
+        name vertex.
+        """
+        names = self._names
+        name = names.get(v)
+        if name is not None:
+            return name
+        if not self._is_name(v):
+            return None
+        # Walk up to the root or to the nearest resolved ancestor.
+        chain = []
+        on_chain = set()
+        prefix = None
+        u = v
+        while True:
+            chain.append(u)
+            on_chain.add(u)
+            parent = self._parent(u)
+            if parent is None or parent in on_chain:
+                break
+            if parent in names:
+                prefix = names[parent]
+                break
+            u = parent
+        for u in reversed(chain):
+            component = self._component(u)
+            prefix = component if prefix is None else f"{prefix}.{component}"
+            names[u] = prefix
+        return names[v]
+
+    def name_of_id(self, name_id):
+        """Returns the full name of the name with unique id name_id, or None."""
+        v = self.graph.index_of("A", name_id)
+        return None if v is None else self.full_name(v)
+
+    def resolve_all(self):
+        """Resolves every name vertex; returns the list of full names by vertex (None elsewhere)."""
+        n = self.graph.num_vertices
+        for v in range(n):
+            self.full_name(v)
+        return [self._names.get(v) for v in range(n)]
+
+
+class RecordNameResolver(NameResolver):
+    """
+    Dotted full names of the name records (#NS/#NI) of an export, by name id,
+    for code that works on decoded records (base.decode_command) instead of a
+    base.Graph. Records of other kinds are ignored.
+    """
+
+    def __init__(self, records):
+        self.graph = None
+        self._names = {}
+        self._records = {record.unique_id: record for record in records if record.kind in _NAME_KINDS}
+
+    def _is_name(self, name_id):
+        return name_id in self._records
+
+    def _parent(self, name_id):
+        parent = self._records[name_id].operands[0]
+        return parent if parent in self._records else None
+
+    def _component(self, name_id):
+        return self._records[name_id].extra
+
+    def name_of_id(self, name_id):
+        return self.full_name(name_id)
+
+    def resolve_all(self):
+        """Resolves every name record; returns the dict of full names by name id."""
+        for name_id in self._records:
+            self.full_name(name_id)
+        return dict(self._names)
+
+
+def full_name_labels(graph, resolver=None):
+    """
+    Returns the labels of a base.Graph with full names propagated:
+       - #NS/#NI:      A_<id>_<full name>                  (A_6_Eq.refl)
+       - #DEF/#AX:     D_<id>_<full name>                  (D_1168_Nat.gcd_self)
+       - #IND:         E_<id>_<full name>
+       - #EC:          C_<id>_<constant>[_<level ids>]     (C_4914_Eq.refl_2)
+       - #EL/#EP:      C_<id>_<binder info>_<binder name>  (C_1_#BD_n)
+    Other labels, and labels whose name is not in the export, are unchanged.
+    """
+    resolver = resolver or NameResolver(graph)
+    names = resolver.resolve_all()
+    groups, ids, kinds, labels = graph.groups, graph.ids, graph.kinds, graph.labels
+    offsets, targets = graph.offsets, graph.targets
+    declaration_groups = (base.GROUP_CODES["D"], base.GROUP_CODES["E"])
+    constant, lambda_, forall = base.KIND_CODES["#EC"], base.KIND_CODES["#EL"], base.KIND_CODES["#EP"]
+    slot_n0 = graph.slots.index("n0") if "n0" in graph.slots else None
+
+    def name_target(v):
+        # The name an #EC/#EL/#EP refers to is its slot "n0" target.
+        e = offsets[v]
+        if e < offsets[v + 1] and graph.slot_codes[e] == slot_n0 and kinds[targets[e]] in _NAME_KINDS:
+            return names[targets[e]]
+        return None
+
+    result = list(labels)
+    for v in range(graph.num_vertices):
+        kind = kinds[v]
+        prefix = f"{base.GROUPS[groups[v]]}_{ids[v]}"
+        if kind in _NAME_KINDS:
+            result[v] = f"{prefix}_{names[v]}"
+        elif groups[v] in declaration_groups:
+            name = resolver.name_of_id(ids[v])
+            if name is not None:
+                result[v] = f"{prefix}_{name}"
+        elif kind == constant:
+            name = name_target(v)
+            if name is not None:
+                # The label suffix is "<name id>[_<level ids>]".
+                levels = labels[v][len(prefix) + 1:].partition("_")[2]
+                result[v] = f"{prefix}_{name}_{levels}" if levels else f"{prefix}_{name}"
+        elif kind == lambda_ or kind == forall:
+            name = name_target(v)
+            if name is not None:
+                result[v] = f"{labels[v]}_{name}"
+    return result
@@ -0,0 +1,167 @@
+import array
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import base
+import compressed
+
+"""
+This is the parallel I/O module.
+It splits a single large export into byte ranges at newline boundaries and runs
+main.main in a process pool. Each shard's lines are decoded once, in phase one, into
+compact arrays: its vertex keys, its labels as one UTF-8 blob, and its references as
+(source line, target group, target id, slot) columns. The parent merges the keys into a
+base._KeyIndex from every key to the line defining it (the later line wins, as with
+vertices_dict) and the labels into one blob. Phase two then resolves and formats each
+shard's references. Its forked workers inherit the arrays, whose contents stay shared
+with the parent, as refcount updates only touch a few object headers. The per-shard
+edge blocks are written in shard order, so the output equals the sequential graph.csv.
+"""
+
+# Set in each phase-two worker by _init_edge_worker.
+_merged = None
+
+
+def shard_ranges(file_path, num_shards):
+    """
+    Splits a file into at most num_shards byte ranges (start, end), each ending
+    just after a newline (or at the end of the file).
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    with open(file_path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = []
+        start = 0
+        for i in range(1, num_shards + 1):
+            if start >= size:
+                break
+            end = size if i == num_shards else max(size * i // num_shards, start)
+            if end < size:
+                newline = mm.find(b'\n', end)
+                end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _read_commands(file_path, start, end):
+    with open(file_path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8')
+    return [command for command in (line.strip() for line in text.split('\n')) if command]
+
+
+def _parse_shard(task):
+    """
+    Phase one: decodes the lines of a shard into (groups, ids, label blob,
+    label offsets, references), where references is (sources, target groups,
+    target ids, slot codes, slots) and sources are line numbers within the shard.
+    """
+    file_path, start, end = task
+    groups = array.array('B')
+    ids = array.array('q')
+    labels = []
+    sources = array.array('i')
+    target_groups = array.array('B')
+    target_ids = array.array('q')
+    slot_codes = array.array('H')
+    slot_index = {}
+    slots = []
+    for line, command in enumerate(_read_commands(file_path, start, end)):
+        record = base.decode_command(command)
+        group, unique_id, label = base.record_identity(record)
+        groups.append(base.GROUP_CODES[group])
+        ids.append(unique_id)
+        labels.append(label)
+        for group, linked_id, slot in base.record_references(record):
+            if linked_id is None:
+                continue  # Never a known key.
+            code = slot_index.get(slot)
+            if code is None:
+                code = slot_index[slot] = len(slots)
+                slots.append(slot)
+            sources.append(line)
+            target_groups.append(base.GROUP_CODES[group])
+            target_ids.append(linked_id)
+            slot_codes.append(code)
+    label_blob, label_offsets = base._pack_strings(labels)
+    return groups, ids, label_blob, label_offsets, (sources, target_groups, target_ids, slot_codes, slots)
+
+
+def _merge_shards(shards):
+    """
+    Merges the phase-one parts of every shard, in order, into (index, label
+    blob, label offsets, references): index maps every key (group code,
+    unique_id) to the global number of its last defining line, whose label is
+    blob[offsets[n]:offsets[n + 1]]; references[i] is the references of shard i
+    with the global number of its first line.
+    """
+    index = base._KeyIndex()
+    label_blob = bytearray()
+    label_offsets = array.array('q', [0])
+    references = []
+    line_count = 0
+    for groups, ids, blob, offsets, shard_references in shards:
+        for line in range(len(ids)):
+            index.set(groups[line], ids[line], line_count + line)
+        base_offset = len(label_blob)
+        label_blob += blob
+        label_offsets.extend(base_offset + offset for offset in offsets[1:])
+        references.append((line_count, shard_references))
+        line_count += len(ids)
+    return index, bytes(label_blob), label_offsets, references
+
+
+def _init_edge_worker(merged):
+    global _merged
+    _merged = merged
+
+
+def _edge_shard(shard_number):
+    """Phase two: the CSV rows of a shard's edges, as one block of text."""
+    index, label_blob, label_offsets, references = _merged
+    first_line, (sources, target_groups, target_ids, slot_codes, slots) = references[shard_number]
+    block = io.StringIO()
+    writer = csv.writer(block)
+    source, source_label = -1, None
+    for e in range(len(sources)):
+        target = index.get(target_groups[e], target_ids[e])
+        if target is None:
+            continue
+        if sources[e] != source:
+            source = sources[e]
+            line = first_line + source
+            source_label = label_blob[label_offsets[line]:label_offsets[line + 1]].decode('utf-8')
+        target_label = label_blob[label_offsets[target]:label_offsets[target + 1]].decode('utf-8')
+        writer.writerow([source_label, target_label, slots[slot_codes[e]]])
+    return block.getvalue()
+
+
+def parallel_edge_csv(file_path, output_path, jobs=None, shards_per_job=4):
+    """
+    Writes the graph CSV of an export ("-" for standard output) using a pool
+    of jobs processes.
+
+    The file is cut into jobs * shards_per_job byte ranges so that workers stay
+    busy when shards differ in cost. Returns the number of shards processed.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    ranges = shard_ranges(file_path, jobs * shards_per_job)
+    tasks = [(file_path, start, end) for start, end in ranges]
+    # Forked workers inherit the merged arrays instead of receiving a pickled copy.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+    with context.Pool(jobs) as pool:
+        merged = _merge_shards(pool.imap(_parse_shard, tasks))
+
+    with compressed.output_file(output_path) as csvfile, \
+            context.Pool(jobs, initializer=_init_edge_worker, initargs=(merged,)) as pool:
+        csv.writer(csvfile).writerow(['source', 'target', 'dependency_kind'])
+        for block in pool.imap(_edge_shard, range(len(tasks))):
+            csvfile.write(block)
+    return len(tasks)
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import csv
+import os
+import shlex
+import sys
+import time
+import base
+import compressed
+
+"""
+This is the exporter pipeline module.
+Instead of waiting for the Lean exporter to write Export.txt and reading it back, it runs
+the exporter processes itself, with EXPORT_PATH=- so that Main.lean writes the export to
+standard output, and parses each process's output line by line as it arrives. Every line
+is fed to a base.EdgeStream (the state of base.stream_edge_list) and turned into edges at
+once, so the graph.csv of a theorem is being written while Lean is still exporting it.
+Several exporters run concurrently under asyncio; their Lean processes work in parallel
+while this process parses whatever output is ready.
+
+The exporter is any command template with a {name} placeholder, so a script that prints an
+existing export can stand in for Lean when testing:
+
+Usage:
+    python3 pipeline.py <Name> [<Name> ...] [--command "lake exe foo Foo.Test -- {name}"]
+                        [--output-dir graphs] [--jobs 4]
+    python3 pipeline.py Nat.gcd_self --command 'cat "Example Exports/{name}/{name}.txt"'
+"""
+
+DEFAULT_COMMAND = "lake exe foo Foo.Test -- {name}"
+LINE_LIMIT = 1 << 24
+
+
+def exporter_argv(template, name):
+    """The argument vector of the exporter command for one declaration name."""
+    return [argument.replace("{name}", name) for argument in shlex.split(template)]
+
+
+async def export_graph(template, name, output_path):
+    """
+    Runs the exporter of one declaration and writes its edges to output_path
+    (a graph.csv; a .gz, .bz2 or .xz path is compressed) while the exporter runs.
+
+    Returns a dictionary with the name, the output path, the numbers of lines and
+    edges, the seconds taken and the error (None on success).
+    """
+    started = time.perf_counter()
+    env = dict(os.environ, EXPORT_PATH="-")
+    result = {"name": name, "output": output_path, "lines": 0, "edges": 0, "seconds": 0.0, "error": None}
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *exporter_argv(template, name), stdout=asyncio.subprocess.PIPE, env=env, limit=LINE_LIMIT)
+    except OSError as error:
+        result["error"] = str(error)
+        return result
+    # As in base.stream_edge_list, a line may only refer to earlier lines.
+    stream = base.EdgeStream()
+    lines = edges = 0
+    try:
+        with compressed.output_file(output_path) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["source", "target", "dependency_kind"])
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8").strip()
+                if not command:
+                    continue
+                lines += 1
+                for source, target, dep_kind in stream.feed(command):
+                    writer.writerow([source[2], target[2], dep_kind])
+                    edges += 1
+    except Exception as error:
+        process.kill()
+        result["error"] = f"{type(error).__name__}: {error}"
+    returncode = await process.wait()
+    if result["error"] is None and returncode != 0:
+        result["error"] = f"exporter exited with status {returncode}"
+    result.update(lines=lines, edges=edges, seconds=time.perf_counter() - started)
+    return result
+
+
+async def run_pipeline(names, template=DEFAULT_COMMAND, output_dir=".", jobs=4, suffix=""):
+    """
+    Exports and converts every declaration name, at most jobs at a time.
+    Each graph is written to output_dir/<name>.csv, plus suffix (.gz, .bz2 or
+    .xz to compress it). Returns the results of export_graph, in the order of
+    names.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    slots = asyncio.Semaphore(jobs)
+
+    async def one(name):
+        async with slots:
+            return await export_graph(template, name, os.path.join(output_dir, f"{name}.csv{suffix}"))
+
+    return await asyncio.gather(*(one(name) for name in names))
+
+
+def main_pipeline():
+    parser = argparse.ArgumentParser(description="Converts Lean exports into graph.csv files while they are exported.")
+    parser.add_argument("names", nargs="+", help="full names of the declarations to export")
+    parser.add_argument("--command", default=DEFAULT_COMMAND,
+                        help=f"exporter command template, with {{name}} for the declaration (default: {DEFAULT_COMMAND})")
+    parser.add_argument("--output-dir", default=".", help="directory of the <name>.csv outputs (default: .)")
+    parser.add_argument("--jobs", type=int, default=4, help="number of concurrent exporters (default: 4)")
+    parser.add_argument("--compress", choices=["gz", "bz2", "xz"],
+                        help="write compressed <name>.csv.gz (.bz2, .xz) outputs")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_pipeline(args.names, args.command, args.output_dir, args.jobs,
+                                      f".{args.compress}" if args.compress else ""))
+    failed = 0
+    for result in results:
+        if result["error"] is None:
+            print(f"{result['name']}\t{result['lines']} lines\t{result['edges']} edges\t"
+                  f"{result['seconds']:.2f}s\t{result['output']}")
+        else:
+            failed += 1
+            print(f"Error: {result['name']}: {result['error']}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_pipeline()
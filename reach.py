@@ -0,0 +1,169 @@
+import argparse
+import array
+import sys
+import base
+import main
+
+"""
+This is the reachability module.
+It precomputes an index over a base.Graph (the edges of base.compute_edge_list) that
+answers dependency-closure queries without a traversal per query.
+
+The index is an interval labeling over a spanning forest (Agrawal, Borgida and Jagadish's
+tree cover). A depth-first search numbers every vertex in postorder, so the vertices of
+each search subtree get a contiguous range of numbers. Each vertex then keeps the merged
+list of number ranges covering everything it reaches; it is computed once per vertex,
+children first, in base.topological_order. With those lists:
+   - membership ("is v in the cone of u?") is a binary search over u's ranges,
+   - the cone size is the sum of the range lengths (precomputed),
+   - enumerating the cone walks the ranges, in time linear in the output.
+
+The cone of a vertex contains the vertex itself.
+
+Usage:
+    python3 reach.py <InputFilePath> <Root> [<Root> ...] [--list]
+where a root is a vertex label or its key prefix, e.g. D_1234.
+"""
+
+
+class ReachabilityIndex:
+    """
+    Reachability index of a base.Graph.
+
+    Attributes:
+        post: postorder number of every vertex.
+        vertex_at: the vertex of every postorder number.
+        sizes: cone size of every vertex.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        n = graph.num_vertices
+        offsets, targets = graph.offsets, graph.targets
+        order = base.topological_order(graph)
+
+        # Postorder numbers over a spanning forest. Roots are taken parents
+        # first, so every search starts at a vertex nothing unvisited reaches.
+        post = array.array("i", [-1]) * n
+        low = array.array("i", bytes(4 * n))
+        vertex_at = array.array("i", bytes(4 * n))
+        visited = bytearray(n)
+        counter = 0
+        for root in reversed(order):
+            if visited[root]:
+                continue
+            visited[root] = 1
+            low[root] = counter
+            stack = [(root, offsets[root])]
+            while stack:
+                v, e = stack[-1]
+                if e == offsets[v + 1]:
+                    stack.pop()
+                    post[v] = counter
+                    vertex_at[counter] = v
+                    counter += 1
+                    continue
+                stack[-1] = (v, e + 1)
+                t = targets[e]
+                if not visited[t]:
+                    visited[t] = 1
+                    low[t] = counter
+                    stack.append((t, offsets[t]))
+
+        # Merged ranges of every vertex, children first. Each list is a flat
+        # array [start0, end0, start1, end1, ...] of inclusive, sorted, disjoint
+        # ranges; a vertex whose children add nothing outside its own subtree
+        # keeps just its tree range.
+        intervals = [None] * n
+        sizes = array.array("q", bytes(8 * n))
+        for v in order:
+            ranges = [(low[v], post[v])]
+            for e in range(offsets[v], offsets[v + 1]):
+                child = intervals[targets[e]]
+                for i in range(0, len(child), 2):
+                    start, end = child[i], child[i + 1]
+                    if start < low[v] or end > post[v]:
+                        ranges.append((start, end))
+            ranges.sort()
+            merged = array.array("i")
+            for start, end in ranges:
+                if merged and start <= merged[-1] + 1:
+                    if end > merged[-1]:
+                        merged[-1] = end
+                else:
+                    merged.append(start)
+                    merged.append(end)
+            intervals[v] = merged
+            sizes[v] = sum(merged[i + 1] - merged[i] + 1 for i in range(0, len(merged), 2))
+
+        self.post = post
+        self.vertex_at = vertex_at
+        self.sizes = sizes
+        self._intervals = intervals
+
+    def reaches(self, u, v):
+        """Whether vertex v is in the cone of vertex u (u depends on v, or u == v)."""
+        ranges = self._intervals[u]
+        p = self.post[v]
+        lo, hi = 0, len(ranges) // 2
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ranges[2 * mid + 1] < p:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(ranges) // 2 and ranges[2 * lo] <= p
+
+    def cone_size(self, u):
+        """Number of vertices in the cone of u, including u."""
+        return self.sizes[u]
+
+    def cone(self, u):
+        """Yields the vertices of the cone of u, including u."""
+        ranges, vertex_at = self._intervals[u], self.vertex_at
+        for i in range(0, len(ranges), 2):
+            for p in range(ranges[i], ranges[i + 1] + 1):
+                yield vertex_at[p]
+
+    def num_intervals(self):
+        """Total number of ranges stored, a measure of the index size."""
+        return sum(len(ranges) for ranges in self._intervals) // 2
+
+
+def parse_root(graph, root):
+    """
+    Returns the vertex of a root given as a label or a key prefix (D_1234),
+    or None if there is no such vertex.
+    """
+    group, _, rest = root.partition("_")
+    unique_id = rest.split("_", 1)[0]
+    try:
+        return graph.index_of(group, int(unique_id))
+    except ValueError:
+        return None
+
+
+def main_reach():
+    parser = argparse.ArgumentParser(description="Queries the dependency cones of a Lean export.")
+    parser.add_argument("input", help="path to the Export.txt file")
+    parser.add_argument("roots", nargs="+", help="vertex labels or key prefixes, e.g. D_1234")
+    parser.add_argument("--list", action="store_true", help="print the label of every vertex in each cone")
+    args = parser.parse_args()
+
+    commands = main.parse_declaration_commands(args.input)
+    graph = base.build_graph([base.decode_command(command) for command in commands])
+    del commands
+    index = ReachabilityIndex(graph)
+    for root in args.roots:
+        v = parse_root(graph, root)
+        if v is None:
+            print(f"Error: No vertex {root} in {args.input}")
+            sys.exit(1)
+        print(f"{graph.labels[v]}\t{index.cone_size(v)}")
+        if args.list:
+            for u in index.cone(v):
+                print(f"\t{graph.labels[u]}")
+
+
+if __name__ == "__main__":
+    main_reach()
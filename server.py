@@ -0,0 +1,408 @@
+import argparse
+import array
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base
+import examples
+import main
+import names
+import reach
+
+"""
+This is the query server module.
+It keeps parsed exports resident so that notebooks and labeling tools can query them
+without rerunning main.py. Exports are parsed once (main.read_declaration_commands,
+base.build_graph) on first use and kept in a GraphCache: a least-recently-used cache
+bounded by an estimate of the memory its graphs and their indexes take. An export that
+changes on disk is parsed again on its next request. Errors, including a path that is not
+a readable export, are answered with a JSON {"error": ...} body.
+
+Usage:
+    python3 server.py [--root DIR] [--port 8000] [--memory 4096]
+Endpoints (GET; export is a path relative to --root, vertices are labels or key
+prefixes such as D_1168, declarations may also be given by dotted name):
+    /graphs                                    the resident exports (JSON)
+    /neighbors?export=E&vertex=V[&direction=out|in|both]
+    /edges?export=E&slot=n0[&slot=n1...]       edges of the given dependency kinds (CSV)
+    /subgraph?export=E&root=Nat.gcd_self[&cone=1]
+        edges of the declaration's subgraph (examples.declaration_subgraph),
+        or of its whole dependency cone with cone=1 (JSON)
+    /csv?export=E                              the graph.csv of the export (CSV)
+"""
+
+MEMORY_BUDGET = 4096 << 20
+
+
+def graph_bytes(graph):
+    """Rough estimate of the memory taken by a base.Graph, its vertex index included once built."""
+    total = _array_bytes(graph.groups, graph.ids, graph.kinds, graph.offsets, graph.targets, graph.slot_codes)
+    total += sum(sys.getsizeof(label) + 8 for label in graph.labels)
+    if graph._index is not None:
+        total += graph._index.nbytes()
+    return total
+
+
+def _array_bytes(*arrays):
+    return sum(a.itemsize * len(a) for a in arrays)
+
+
+class LoadedExport:
+    """
+    A resident export: its base.Graph plus indexes built on first use.
+
+    nbytes estimates the memory of the graph and of the indexes built so far. It
+    is measured again whenever an index is built, and on_resize (if given) is
+    then called, so that the owning GraphCache can evict.
+    """
+
+    def __init__(self, path, stamp, graph, on_resize=None):
+        self.path = path
+        self.stamp = stamp
+        self.graph = graph
+        self._lock = threading.Lock()
+        self._reverse = None
+        self._declarations = None
+        self._reach = None
+        self._on_resize = on_resize
+        self.nbytes = self._measure()
+
+    def _measure(self):
+        total = graph_bytes(self.graph)
+        if self._reverse is not None:
+            total += _array_bytes(*self._reverse)
+        if self._reach is not None:
+            index = self._reach
+            total += _array_bytes(index.post, index.vertex_at, index.sizes)
+            total += sys.getsizeof(index._intervals) + sum(sys.getsizeof(ranges) for ranges in index._intervals)
+        if self._declarations is not None:
+            total += sys.getsizeof(self._declarations) + sum(sys.getsizeof(name) + 32 for name in self._declarations)
+        return total
+
+    def _resized(self):
+        self.nbytes = self._measure()
+        if self._on_resize is not None:
+            self._on_resize()
+
+    def reverse(self):
+        """(offsets, sources, edge indices) of the incoming edges of every vertex, in CSR form."""
+        built = False
+        with self._lock:
+            if self._reverse is None:
+                built = True
+                graph = self.graph
+                n = graph.num_vertices
+                counts = array.array("q", bytes(8 * (n + 1)))
+                for t in graph.targets:
+                    counts[t + 1] += 1
+                for v in range(n):
+                    counts[v + 1] += counts[v]
+                fill = counts[:-1]
+                sources = array.array("i", bytes(4 * graph.num_edges))
+                edges = array.array("q", bytes(8 * graph.num_edges))
+                offsets, targets = graph.offsets, graph.targets
+                for v in range(n):
+                    for e in range(offsets[v], offsets[v + 1]):
+                        t = targets[e]
+                        sources[fill[t]] = v
+                        edges[fill[t]] = e
+                        fill[t] += 1
+                self._reverse = (counts, sources, edges)
+            reverse = self._reverse
+        if built:
+            self._resized()
+        return reverse
+
+    def reachability(self):
+        built = False
+        with self._lock:
+            if self._reach is None:
+                built = True
+                self._reach = reach.ReachabilityIndex(self.graph)
+            index = self._reach
+        if built:
+            self._resized()
+        return index
+
+    def resolve(self, root):
+        """The vertex of a label, key prefix or dotted declaration name, or None."""
+        graph = self.graph
+        indexed = graph._index is not None
+        v = reach.parse_root(graph, root)
+        built = False
+        if v is None:
+            with self._lock:
+                if self._declarations is None:
+                    built = True
+                    resolver = names.NameResolver(graph)
+                    declaration_groups = (base.GROUP_CODES["D"], base.GROUP_CODES["E"])
+                    self._declarations = {}
+                    for u in range(graph.num_vertices):
+                        if graph.groups[u] in declaration_groups:
+                            name = resolver.name_of_id(graph.ids[u])
+                            if name is not None:
+                                self._declarations[name] = u
+                v = self._declarations.get(root)
+        # parse_root and the NameResolver build the graph's vertex index on first use.
+        if built or (not indexed and graph._index is not None):
+            self._resized()
+        return v
+
+
+class GraphCache:
+    """
+    Parsed exports by path, least recently used first, within a memory budget.
+    The most recently loaded export is kept even if it alone exceeds the budget.
+    """
+
+    def __init__(self, max_bytes=MEMORY_BUDGET):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def get(self, path):
+        """
+        Returns the LoadedExport of path, parsing it if needed. Raises OSError if
+        path cannot be read and ValueError if it is not a well-formed export.
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.stamp == stamp:
+                self._entries.move_to_end(path)
+                return entry
+            # One thread parses a given export; the others wait for it.
+            loading = self._loading.get(path)
+            if loading is None:
+                loading = self._loading[path] = threading.Lock()
+        with loading:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry.stamp == stamp:
+                    self._entries.move_to_end(path)
+                    return entry
+            try:
+                commands = main.read_declaration_commands(path)
+                graph = base.build_graph([base.decode_command(command) for command in commands])
+                del commands
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(path, None)
+                raise
+            entry = LoadedExport(path, stamp, graph, self._shrink)
+            with self._lock:
+                self._entries[path] = entry
+                self._entries.move_to_end(path)
+                self._evict()
+                self._loading.pop(path, None)
+            return entry
+
+    def _shrink(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers the queries of a QueryServer."""
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        handler = {
+            "/graphs": self._graphs,
+            "/neighbors": self._neighbors,
+            "/edges": self._edges,
+            "/subgraph": self._subgraph,
+            "/csv": self._csv,
+        }.get(url.path)
+        if handler is None:
+            self._error(404, f"No endpoint {url.path}")
+            return
+        try:
+            handler(query)
+        except _QueryError as error:
+            self._error(error.status, str(error))
+        except Exception as error:
+            self._error(500, f"{type(error).__name__}: {error}")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    # Helpers.
+
+    def _error(self, status, message):
+        self._send_json({"error": message}, status)
+
+    def _send_json(self, value, status=200):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_csv(self, rows):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.end_headers()
+        # HTTP/1.0: the body runs until the connection closes, so it is streamed.
+        text = io.TextIOWrapper(self.wfile, encoding="utf-8", newline="", write_through=False)
+        writer = csv.writer(text)
+        writer.writerow(["source", "target", "dependency_kind"])
+        writer.writerows(rows)
+        text.flush()
+        text.detach()
+
+    def _export(self, query):
+        relative = _parameter(query, "export")
+        root = self.server.root
+        path = os.path.realpath(os.path.join(root, relative))
+        if os.path.commonpath([root, path]) != root:
+            raise _QueryError(403, f"{relative} is outside the served directory")
+        try:
+            return self.server.graphs.get(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise _QueryError(404, f"No export {relative}")
+        except IsADirectoryError:
+            raise _QueryError(400, f"{relative} is a directory")
+        except PermissionError:
+            raise _QueryError(403, f"{relative} cannot be read")
+        except ValueError as error:
+            raise _QueryError(422, f"{relative} is not a readable export: {error}")
+
+    def _vertex(self, entry, root):
+        v = entry.resolve(root)
+        if v is None:
+            raise _QueryError(404, f"No vertex {root}")
+        return v
+
+    # Endpoints.
+
+    def _graphs(self, query):
+        root = self.server.root
+        self._send_json([{"export": os.path.relpath(entry.path, root), "vertices": entry.graph.num_vertices,
+                          "edges": entry.graph.num_edges, "bytes": entry.nbytes}
+                         for entry in self.server.graphs.entries()])
+
+    def _neighbors(self, query):
+        entry = self._export(query)
+        graph = entry.graph
+        v = self._vertex(entry, _parameter(query, "vertex"))
+        direction = _parameter(query, "direction", "out")
+        if direction not in ("out", "in", "both"):
+            raise _QueryError(400, f"Unknown direction {direction}")
+        labels, slots, slot_codes = graph.labels, graph.slots, graph.slot_codes
+        result = {"vertex": labels[v]}
+        if direction in ("out", "both"):
+            result["out"] = [[labels[graph.targets[e]], slots[slot_codes[e]]]
+                             for e in range(graph.offsets[v], graph.offsets[v + 1])]
+        if direction in ("in", "both"):
+            offsets, sources, edges = entry.reverse()
+            result["in"] = [[labels[sources[i]], slots[slot_codes[edges[i]]]]
+                            for i in range(offsets[v], offsets[v + 1])]
+        self._send_json(result)
+
+    def _edges(self, query):
+        graph = self._export(query).graph
+        wanted = query.get("slot")
+        if not wanted:
+            raise _QueryError(400, "Missing parameter slot")
+        codes = {graph.slots.index(slot) for slot in wanted if slot in graph.slots}
+        labels, slots = graph.labels, graph.slots
+        offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+        self._send_csv([labels[v], labels[targets[e]], slots[slot_codes[e]]]
+                       for v in range(graph.num_vertices)
+                       for e in range(offsets[v], offsets[v + 1]) if slot_codes[e] in codes)
+
+    def _subgraph(self, query):
+        entry = self._export(query)
+        graph = entry.graph
+        v = self._vertex(entry, _parameter(query, "root"))
+        labels, slots = graph.labels, graph.slots
+        if _parameter(query, "cone", "0") not in ("", "0"):
+            offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+            cone = sorted(entry.reachability().cone(v))
+            edges = [[labels[u], labels[targets[e]], slots[slot_codes[e]]]
+                     for u in cone for e in range(offsets[u], offsets[u + 1])]
+        else:
+            edges = [[labels[source], labels[target], slots[slot]]
+                     for source, target, slot in examples.declaration_subgraph(graph, v)]
+        self._send_json({"root": labels[v], "edges": edges})
+
+    def _csv(self, query):
+        graph = self._export(query).graph
+        labels, slots = graph.labels, graph.slots
+        offsets, targets, slot_codes = graph.offsets, graph.targets, graph.slot_codes
+        self._send_csv([labels[v], labels[targets[e]], slots[slot_codes[e]]]
+                       for v in range(graph.num_vertices) for e in range(offsets[v], offsets[v + 1]))
+
+
+class _QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _parameter(query, name, default=None):
+    values = query.get(name)
+    if values:
+        return values[0]
+    if default is None:
+        raise _QueryError(400, f"Missing parameter {name}")
+    return default
+
+
+class QueryServer(ThreadingHTTPServer):
+    """A threading HTTP server answering queries over the exports under root."""
+
+    daemon_threads = True
+
+    def __init__(self, address, root, max_bytes=MEMORY_BUDGET, quiet=False):
+        super().__init__(address, QueryHandler)
+        self.root = os.path.realpath(root)
+        self.graphs = GraphCache(max_bytes)
+        self.quiet = quiet
+
+
+def main_server():
+    parser = argparse.ArgumentParser(description="Serves queries over Lean exports kept in memory.")
+    parser.add_argument("--root", default=".", help="directory the export paths are relative to (default: .)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument("--memory", type=int, default=MEMORY_BUDGET >> 20, metavar="MB",
+                        help="memory budget of the resident graphs (default: 4096)")
+    args = parser.parse_args()
+    if not os.path.isdir(args.root):
+        print(f"Error: No directory {args.root}")
+        sys.exit(1)
+    server = QueryServer((args.host, args.port), args.root, args.memory << 20)
+    print(f"Serving {server.root} on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main_server()
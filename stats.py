@@ -0,0 +1,110 @@
+import json
+import time
+import base
+
+"""
+This is the instrumentation module.
+It builds the same base.Graph as base.build_graph while recording, for every kind marker,
+the number of lines, the edges produced, the time spent decoding, the references that
+did not resolve (by slot) and the keys that repeat an earlier line's key. Those last two
+are dropped or overwritten silently by the normal pipeline; a non-zero count usually
+means a truncated or corrupted export.
+
+Two kinds of dropped reference are expected in every export and are counted apart:
+references to name 0 and level 0 (the anonymous name and level zero, which the exporter
+never writes out), and Group C references to #EJ/#ELN/#ELS/#EZ expressions, which share
+the expression numbering but are keyed in Group G.
+
+Instrumentation is opt-in: the normal pipeline never calls into this module, so it costs
+nothing when turned off.
+"""
+
+
+class ParseStats:
+    """Per-kind counters filled in by instrumented_build_graph."""
+
+    def __init__(self):
+        self.lines = [0] * len(base.KIND_MARKERS)
+        self.edges = [0] * len(base.KIND_MARKERS)
+        self.nanoseconds = [0] * len(base.KIND_MARKERS)
+        self.duplicate_keys = [0] * len(base.KIND_MARKERS)
+        self.unresolved = [{} for _ in base.KIND_MARKERS]
+        self.implicit = [0] * len(base.KIND_MARKERS)
+        self.group_mismatch = [0] * len(base.KIND_MARKERS)
+        self.vertices = 0
+        self.seconds = 0.0
+
+    def report(self):
+        """Returns the statistics as a JSON-serializable dictionary."""
+        kinds = {}
+        for code, marker in enumerate(base.KIND_MARKERS):
+            if not self.lines[code]:
+                continue
+            kinds[marker] = {
+                "lines": self.lines[code],
+                "edges": self.edges[code],
+                "seconds": self.nanoseconds[code] / 1e9,
+                "unresolved_references": dict(sorted(self.unresolved[code].items())),
+                "implicit_references": self.implicit[code],
+                "group_mismatch_references": self.group_mismatch[code],
+                "duplicate_keys": self.duplicate_keys[code],
+            }
+        return {
+            "lines": sum(self.lines),
+            "vertices": self.vertices,
+            "edges": sum(self.edges),
+            "seconds": self.seconds,
+            "unresolved_references": sum(sum(slots.values()) for slots in self.unresolved),
+            "implicit_references": sum(self.implicit),
+            "group_mismatch_references": sum(self.group_mismatch),
+            "duplicate_keys": sum(self.duplicate_keys),
+            "kinds": kinds,
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=1)
+
+
+def instrumented_build_graph(commands, stats):
+    """
+    Builds the base.Graph of a sequence of declaration commands, recording
+    per-kind statistics in stats (a ParseStats).
+    """
+    started = time.perf_counter()
+    clock = time.perf_counter_ns
+    vertices, kinds, references = [], [], []
+    seen = set()
+    for command in commands:
+        tick = clock()
+        record = base.decode_command(command)
+        vertex = base.record_identity(record)
+        line_references = base.record_references(record)
+        kind = record.kind
+        stats.nanoseconds[kind] += clock() - tick
+        stats.lines[kind] += 1
+        key = (vertex[0], vertex[1])
+        if key in seen:
+            stats.duplicate_keys[kind] += 1
+        else:
+            seen.add(key)
+        vertices.append(vertex)
+        kinds.append(kind)
+        references.append(line_references)
+
+    for kind, line_references in zip(kinds, references):
+        unresolved = stats.unresolved[kind]
+        for group, linked_id, slot in line_references:
+            if (group, linked_id) in seen:
+                stats.edges[kind] += 1
+            elif linked_id == 0 and group in ("A", "B"):
+                stats.implicit[kind] += 1
+            elif group == "C" and ("G", linked_id) in seen:
+                stats.group_mismatch[kind] += 1
+            else:
+                unresolved[slot] = unresolved.get(slot, 0) + 1
+
+    graph = base.assemble_graph(vertices, kinds, references)
+    stats.vertices = graph.num_vertices
+    stats.seconds = time.perf_counter() - started
+    return graph
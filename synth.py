@@ -0,0 +1,184 @@
+import argparse
+import random
+import compressed
+
+"""
+This is the synthetic export module.
+It writes grammatically valid exports of any size for benchmarking. Every line uses the
+syntax of Foo/Export.lean, refers only to items defined on earlier lines, and numbers
+names, levels and expressions in their own sequences, as the exporter does.
+
+The kind mix follows real exports such as Nat.gcd_self (mostly #EA, #EL and #EP, then
+#NS/#NI, #EC and one #DEF every ~50 lines). As the exporter emits the subterms of a
+declaration right before the declaration itself, references stay among the items defined
+since the previous declaration, favouring recent ones, plus a few into a small shared
+prelude. The per-declaration subgraphs (examples.declaration_subgraph) then overlap about
+as much as in Nat.gcd_self: together they have ~1.5 times as many edges as the export.
+
+Usage:
+    python3 synth.py <OutputFilePath> [--lines N] [--seed S]
+"""
+
+# Relative frequencies of the line kinds in Example Exports/Nat.gcd_self.
+KIND_WEIGHTS = {
+    "#EA": 6872, "#EL": 2019, "#EP": 1476, "#NS": 651, "#NI": 523, "#EC": 427,
+    "#DEF": 244, "#EJ": 44, "#IND": 28, "#EV": 23, "#ES": 15, "#US": 7, "#UM": 6,
+    "#UIM": 6, "#UP": 7, "#EZ": 3, "#ELN": 2, "#AX": 1,
+}
+BINDERS = ("#BD", "#BI", "#BS", "#BC")
+# References stay among the items defined since the previous declaration, except for a
+# fraction SHARED of them, which go to the first PRELUDE items of their sequence.
+SHARED = 0.05
+PRELUDE = 256
+COMPONENTS = ("Nat", "Eq", "refl", "gcd", "succ", "zero", "rec", "motive", "α", "h", "n", "m",
+              "Init", "Prelude", "Data", "mod", "self", "_hyg", "mk", "val", "x", "y")
+
+
+class _Generator:
+
+    def __init__(self, seed, locality):
+        self.random = random.Random(seed)
+        self.locality = locality
+        # Index 0 of names and levels is implicit (anonymous name, level zero).
+        self.names = 1
+        self.levels = 1
+        self.exprs = 0
+        # The first id of each sequence since the previous declaration.
+        self.window = (1, 1, 0)
+        self.lines = []
+
+    def recent(self, count, start):
+        """
+        An id among count existing ones: now and then one of the first PRELUDE
+        ids, otherwise one defined since start, with geometrically decaying recency.
+        """
+        r = self.random
+        if count == start or r.random() < SHARED:
+            return r.randrange(min(count, PRELUDE))
+        back = int(r.expovariate(1.0 / self.locality))
+        return count - 1 - back if back < count - start else r.randrange(start, count)
+
+    def name(self):
+        return self.recent(self.names, self.window[0])
+
+    def level(self):
+        return self.recent(self.levels, self.window[1])
+
+    def expr(self):
+        return self.recent(self.exprs, self.window[2])
+
+    def emit(self, kind):
+        r = self.random
+        if kind == "#NS":
+            parent = 0 if r.random() < 0.2 else self.name()
+            self.lines.append(f"{self.names} #NS {parent} {r.choice(COMPONENTS)}")
+            self.names += 1
+        elif kind == "#NI":
+            self.lines.append(f"{self.names} #NI {self.name()} {r.randrange(1000)}")
+            self.names += 1
+        elif kind == "#US":
+            self.lines.append(f"{self.levels} #US {self.level()}")
+            self.levels += 1
+        elif kind in ("#UM", "#UIM"):
+            self.lines.append(f"{self.levels} {kind} {self.level()} {self.level()}")
+            self.levels += 1
+        elif kind == "#UP":
+            self.lines.append(f"{self.levels} #UP {self.name()}")
+            self.levels += 1
+        elif kind == "#EV":
+            self.lines.append(f"{self.exprs} #EV {r.randrange(8)}")
+            self.exprs += 1
+        elif kind == "#ES":
+            self.lines.append(f"{self.exprs} #ES {self.level()}")
+            self.exprs += 1
+        elif kind == "#EC":
+            levels = " ".join(str(self.level()) for _ in range(r.randrange(3)))
+            self.lines.append(f"{self.exprs} #EC {self.name()} {levels}".rstrip())
+            self.exprs += 1
+        elif kind == "#EA":
+            self.lines.append(f"{self.exprs} #EA {self.expr()} {self.expr()}")
+            self.exprs += 1
+        elif kind in ("#EL", "#EP"):
+            self.lines.append(f"{self.exprs} {kind} {r.choice(BINDERS)} {self.name()} {self.expr()} {self.expr()}")
+            self.exprs += 1
+        elif kind == "#EJ":
+            self.lines.append(f"{self.exprs} #EJ {self.name()} {r.randrange(4)} {self.expr()}")
+            self.exprs += 1
+        elif kind == "#ELN":
+            self.lines.append(f"{self.exprs} #ELN {r.randrange(1 << 16)}")
+            self.exprs += 1
+        elif kind == "#EZ":
+            self.lines.append(f"{self.exprs} #EZ {self.name()} {self.expr()} {self.expr()} {self.expr()}")
+            self.exprs += 1
+        else:
+            self.declaration(kind)
+
+    def declaration(self, kind):
+        r = self.random
+        # Every declaration gets a fresh name, defined just before it.
+        self.lines.append(f"{self.names} #NS {self.name()} {r.choice(COMPONENTS)}")
+        name = self.names
+        self.names += 1
+        params = " ".join(str(self.name()) for _ in range(r.randrange(3)))
+        if kind == "#DEF":
+            line = f"#DEF {name} {self.expr()} {self.expr()} {params}"
+        elif kind == "#AX":
+            line = f"#AX {name} {self.expr()} {params}"
+        else:
+            ctors = r.randrange(1, 4)
+            pairs = " ".join(f"{self.name()} {self.expr()}" for _ in range(ctors))
+            line = f"#IND {r.randrange(3)} {name} {self.expr()} {ctors} {pairs} {params}"
+        self.lines.append(line.rstrip())
+        self.window = (self.names, self.levels, self.exprs)
+
+
+def generate_export(lines, seed=0, locality=64.0):
+    """
+    Yields the first `lines` lines of a synthetic export.
+
+    Parameters:
+        lines (int): Number of lines to generate.
+        seed (int): Seed of the pseudo-random generator; equal seeds give equal exports.
+        locality (float): Mean distance, in items, of a reference back from the newest item.
+    """
+    generator = _Generator(seed, locality)
+    # Minimal prelude so that every kind has something to refer to.
+    for kind in ("#NS", "#NS", "#US", "#UP", "#ES", "#EV", "#EC", "#EA"):
+        generator.emit(kind)
+    kinds = list(KIND_WEIGHTS)
+    weights = list(KIND_WEIGHTS.values())
+    emitted = 0
+    while emitted < lines:
+        for kind in generator.random.choices(kinds, weights, k=1024):
+            generator.emit(kind)
+        # Lines only refer backwards, so any prefix is itself a valid export.
+        batch = generator.lines[:lines - emitted]
+        generator.lines = []
+        yield from batch
+        emitted += len(batch)
+
+
+def write_export(path, lines, seed=0, locality=64.0):
+    """
+    Writes a synthetic export of `lines` lines to path ("-" for standard output;
+    a .gz, .bz2 or .xz path is compressed).
+    """
+    with compressed.output_file(path, newline=None) as file:
+        for line in generate_export(lines, seed, locality):
+            file.write(line)
+            file.write("\n")
+
+
+def main_synth():
+    parser = argparse.ArgumentParser(description="Writes a synthetic Lean export for benchmarking.")
+    parser.add_argument("output", help="path of the export to write ('-' for stdout)")
+    parser.add_argument("--lines", type=float, default=1e4, help="number of lines, e.g. 1e6 (default: 1e4)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--locality", type=float, default=64.0,
+                        help="mean distance of a reference back from the newest item (default: 64)")
+    args = parser.parse_args()
+    write_export(args.output, int(args.lines), args.seed, args.locality)
+
+
+if __name__ == "__main__":
+    main_synth()
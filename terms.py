@@ -0,0 +1,332 @@
+import base
+import names
+
+"""
+This is the expression module.
+parse_declaration flattens expressions (#EV, #ES, #EC, #EA, #EL, #EP and the extensions
+#EJ, #ELN, #ELS, #EZ) into edges; TermTable rebuilds them as terms. Terms are hash-consed:
+structurally equal subterms are the same Term object, so a term is a DAG that shares
+exactly what the export shares.
+
+Nothing here recurses. Terms are built with an explicit stack, since application spines
+are far deeper than Python's recursion limit, and size, depth and render walk the DAG
+iteratively, visiting every shared subterm once. render names each shared compound
+subterm once (let %k := ...) instead of expanding it, so its output is linear in the size
+of the DAG even when the tree it denotes is exponentially larger.
+"""
+
+_EXPRESSION_KINDS = frozenset(base.KIND_CODES[marker] for marker in
+                              ("#EV", "#ES", "#EC", "#EA", "#EL", "#EP", "#EJ", "#ELN", "#ELS", "#EZ"))
+_NAME_KINDS = frozenset((base.KIND_CODES["#NS"], base.KIND_CODES["#NI"]))
+_LEVEL_KINDS = frozenset(base.KIND_CODES[marker] for marker in ("#US", "#UM", "#UIM", "#UP"))
+_BRACKETS = {"#BD": ("(", ")"), "#BI": ("{", "}"), "#BS": ("⦃", "⦄"), "#BC": ("[", "]")}
+
+
+class Term:
+    """
+    A hash-consed expression node.
+
+    Attributes:
+        kind: the kind marker of the expression ("#EA", "#EL", ...).
+        payload: a tuple of literal data (de Bruijn index, names, levels,
+            binder info, literal value), depending on the kind.
+        children: a tuple of the subterms, in slot order.
+    """
+
+    __slots__ = ("kind", "payload", "children", "_size", "_depth", "_rendering")
+
+    def __init__(self, kind, payload, children):
+        self.kind = kind
+        self.payload = payload
+        self.children = children
+        self._size = None
+        self._depth = None
+        self._rendering = None
+
+    def __repr__(self):
+        return f"Term({self.kind}, {self.payload!r}, {len(self.children)} children)"
+
+
+def _decode_string(extra):
+    try:
+        return bytes(int(h, 16) for h in extra.split("_") if h).decode("utf-8", errors="replace")
+    except ValueError:
+        return extra
+
+
+class TermTable:
+    """
+    The hash-consed terms of an export.
+
+    Parameters:
+        records: the decoded records (base.decode_command) of the export.
+    """
+
+    def __init__(self, records):
+        name_records = []
+        self.levels = levels = {0: "0"}
+        self._exprs = {}
+        self.declarations = {}
+        level_records = []
+        for record in records:
+            kind = record.kind
+            if kind in _EXPRESSION_KINDS:
+                # #EJ/#ELN/#ELS/#EZ are keyed in Group G but share the expression numbering.
+                self._exprs[record.unique_id] = record
+            elif kind in _NAME_KINDS:
+                name_records.append(record)
+            elif kind in _LEVEL_KINDS:
+                level_records.append(record)
+            elif base.KIND_GROUPS[kind] == "D":
+                self.declarations[record.unique_id] = record
+        self.resolver = names.RecordNameResolver(name_records)
+        self._by_name = None
+        # Levels only refer to earlier levels, so one pass in file order renders them.
+        for record in level_records:
+            marker = base.KIND_MARKERS[record.kind]
+            operands = record.operands
+            if marker == "#UP":
+                levels[record.unique_id] = self.name(operands[0])
+            elif marker == "#US":
+                levels[record.unique_id] = f"{self.level(operands[0])}+1"
+            else:
+                keyword = "max" if marker == "#UM" else "imax"
+                levels[record.unique_id] = f"({keyword} {self.level(operands[0])} {self.level(operands[1])})"
+        self._terms = {}
+        self._interned = {}
+
+    def name(self, name_id):
+        """The dotted full name of a name id ("?<id>" if it is not in the export)."""
+        if name_id == 0:
+            return "[anonymous]"
+        name = self.resolver.name_of_id(name_id)
+        return f"?{name_id}" if name is None else name
+
+    def level(self, level_id):
+        """The rendering of a level id ("?<id>" if it is not in the export)."""
+        return self.levels.get(level_id, f"?{level_id}")
+
+    def _intern(self, kind, payload, children):
+        key = (kind, payload, children)
+        term = self._interned.get(key)
+        if term is None:
+            term = self._interned[key] = Term(kind, payload, children)
+        return term
+
+    def _children(self, record):
+        """The expression ids a record's term is built from, in slot order."""
+        marker = base.KIND_MARKERS[record.kind]
+        operands = record.operands
+        if marker == "#EA":
+            return operands
+        if marker in ("#EL", "#EP"):
+            return operands[1:]
+        if marker == "#EJ":
+            return operands[1:]
+        if marker == "#EZ":
+            return operands[1:]
+        return ()
+
+    def _build(self, record, children):
+        marker = base.KIND_MARKERS[record.kind]
+        operands = record.operands
+        if marker == "#EV":
+            payload = (int(record.extra),)
+        elif marker == "#ES":
+            payload = (self.level(operands[0]),)
+        elif marker == "#EC":
+            payload = (self.name(operands[0]), tuple(self.level(level) for level in operands[1:]))
+        elif marker in ("#EL", "#EP"):
+            payload = (record.extra, self.name(operands[0]))
+        elif marker == "#EJ":
+            payload = (self.name(operands[0]), record.extra)
+        elif marker == "#ELN":
+            payload = (int(record.extra),)
+        elif marker == "#ELS":
+            payload = (_decode_string(record.extra),)
+        elif marker == "#EZ":
+            payload = (self.name(operands[0]),)
+        else:
+            payload = ()
+        return self._intern(marker, payload, children)
+
+    def term(self, expr_id):
+        """
+        Returns the Term of expression expr_id, building it and every subterm
+        not built yet with an explicit stack. Ids missing from the export become
+        terms of kind "?".
+        """
+        terms = self._terms
+        if expr_id in terms:
+            return terms[expr_id]
+        exprs = self._exprs
+        in_progress = set()
+        stack = [expr_id]
+        while stack:
+            current = stack[-1]
+            if current in terms:
+                stack.pop()
+                continue
+            record = exprs.get(current)
+            if record is None:
+                terms[current] = self._intern("?", (current,), ())
+                stack.pop()
+                continue
+            child_ids = self._children(record)
+            missing = [child for child in child_ids if child not in terms]
+            if missing:
+                if current in in_progress:
+                    raise ValueError(f"Expression {current} refers to itself.")
+                in_progress.add(current)
+                stack.extend(missing)
+                continue
+            in_progress.discard(current)
+            terms[current] = self._build(record, tuple(terms[child] for child in child_ids))
+            stack.pop()
+        return terms[expr_id]
+
+    def declaration(self, name):
+        """
+        Returns (kind marker, type term, value term or None) of the #DEF/#AX
+        with the given dotted name, or None.
+        """
+        if self._by_name is None:
+            self._by_name = {}
+            for name_id, record in self.declarations.items():
+                full_name = self.resolver.name_of_id(name_id)
+                if full_name is not None:
+                    self._by_name.setdefault(full_name, record)
+        record = self._by_name.get(name)
+        if record is None:
+            return None
+        operands = record.operands
+        marker = base.KIND_MARKERS[record.kind]
+        value = self.term(operands[1]) if marker == "#DEF" else None
+        return marker, self.term(operands[0]), value
+
+
+def _postorder(term):
+    """The distinct subterms of term, children before parents, without recursion."""
+    order = []
+    seen = {id(term)}
+    stack = [(term, 0)]
+    while stack:
+        node, i = stack[-1]
+        if i < len(node.children):
+            stack[-1] = (node, i + 1)
+            child = node.children[i]
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append((child, 0))
+        else:
+            stack.pop()
+            order.append(node)
+    return order
+
+
+def size(term):
+    """Number of nodes of term as a tree (shared subterms counted every time they occur)."""
+    if term._size is None:
+        for node in _postorder(term):
+            if node._size is None:
+                node._size = 1 + sum(child._size for child in node.children)
+    return term._size
+
+
+def depth(term):
+    """Number of nodes on the longest root-to-leaf path of term."""
+    if term._depth is None:
+        for node in _postorder(term):
+            if node._depth is None:
+                node._depth = 1 + max((child._depth for child in node.children), default=0)
+    return term._depth
+
+
+def dag_size(term):
+    """Number of distinct subterms of term, including term itself."""
+    return len(_postorder(term))
+
+
+def _is_atomic(term):
+    return not term.children and term.kind != "#ES"
+
+
+def render(term):
+    """
+    Pretty-prints term in a Lean-like syntax.
+
+    Compound subterms that occur more than once are printed once, as
+    "let %k := ..." lines before the body, and referred to as %k, so the
+    output is linear in dag_size(term). The result is kept on term, so
+    rendering it again is free.
+    """
+    if term._rendering is None:
+        term._rendering = _render(term)
+    return term._rendering
+
+
+def _render(term):
+    order = _postorder(term)
+    uses = {}
+    for node in order:
+        for child in node.children:
+            uses[id(child)] = uses.get(id(child), 0) + 1
+    shared = {}
+    for node in order:
+        if node is not term and uses.get(id(node), 0) > 1 and not _is_atomic(node):
+            shared[id(node)] = f"%{len(shared)}"
+
+    def emit(root):
+        tokens = []
+        # Items are either strings or (term, parenthesize) pairs to expand.
+        stack = [(root, False)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                tokens.append(item)
+                continue
+            node, parenthesize = item
+            if node is not root and id(node) in shared:
+                tokens.append(shared[id(node)])
+                continue
+            parts = _layout(node)
+            if parenthesize and not _is_atomic(node):
+                parts = ["("] + parts + [")"]
+            stack.extend(reversed(parts))
+        return "".join(tokens)
+
+    lines = [f"let {shared[id(node)]} := {emit(node)}" for node in order if id(node) in shared]
+    lines.append(emit(term))
+    return "\n".join(lines)
+
+
+def _layout(node):
+    """One level of render: strings and (child, parenthesize) pairs."""
+    kind, payload, children = node.kind, node.payload, node.children
+    if kind == "#EV":
+        return [f"#{payload[0]}"]
+    if kind == "#ES":
+        return [f"Sort {payload[0]}"]
+    if kind == "#EC":
+        name, levels = payload
+        return [f"{name}.{{{', '.join(levels)}}}" if levels else name]
+    if kind == "#EA":
+        function, argument = children
+        return [(function, function.kind in ("#EL", "#EP", "#EZ")), " ", (argument, True)]
+    if kind in ("#EL", "#EP"):
+        info, name = payload
+        binder_type, body = children
+        opening, closing = _BRACKETS.get(info, ("(", ")"))
+        if kind == "#EL":
+            return [f"fun {opening}{name} : ", (binder_type, False), f"{closing} => ", (body, False)]
+        return [f"{opening}{name} : ", (binder_type, False), f"{closing} → ", (body, False)]
+    if kind == "#EJ":
+        return [(children[0], True), f".{payload[1]}"]
+    if kind == "#ELN":
+        return [str(payload[0])]
+    if kind == "#ELS":
+        return [repr(payload[0])]
+    if kind == "#EZ":
+        binder_type, value, body = children
+        return [f"let {payload[0]} : ", (binder_type, False), " := ", (value, False), "; ", (body, False)]
+    return [f"?{payload[0]}" if payload else "?"]